@@ -0,0 +1,113 @@
+import csv
+import json
+from datetime import datetime, date
+from admin.models import db, StaffModel, TimeLogModel
+from utils.utilities import BaseUtil, ModelUtil
+
+
+
+class RowBuffer:
+    """File like sink for csv.writer that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self.parts = []
+
+
+    def write(self, data):
+        self.parts.append(data)
+
+
+    def drain(self):
+        data = "".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+
+
+class TimeLogExporter:
+    """Streams the timelogs of a date range (and optionally a set of staff) as CSV or NDJSON chunks.
+
+    Rows are read through TimeLogModel.iter_timelog in (clock_in, id) order,
+    walking ix_timelogs_clock_in_id instead of sorting the table, and
+    flushed every chunk_size bytes, so memory stays constant however many
+    rows match. The first line and the first batch are flushed as soon as
+    they are read so clients see bytes early.
+    """
+
+    FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+    FIELDS = ("id", "staff_id", "staff_name", "clock_in", "clock_out", "worked_hours", "updated_at")
+
+    def __init__(self, export_format = "csv", date_from = None, date_to = None, staff_ids = None, batch_size = 1000, chunk_size = 64 * 1024):
+        BaseUtil.perform_value_check(export_format, list(self.FORMATS), "format")
+        self.export_format = export_format
+        self.date_from = date_from
+        self.date_to = date_to
+        self.staff_ids = list(staff_ids) if staff_ids else None
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+
+
+    @property
+    def mimetype(self):
+        return self.FORMATS[self.export_format]
+
+
+    @property
+    def filename(self):
+        period = "_".join(str(day) for day in (self.date_from, self.date_to) if day) or "all"
+        return f"timelogs_{period}.{self.export_format}"
+
+
+    def staff_names(self):
+        query = db.session.query(StaffModel.id, StaffModel.name)
+        if self.staff_ids:
+            query = query.filter(StaffModel.id.in_(self.staff_ids))
+        return dict(query.all())
+
+
+    @ModelUtil.on_replica(db)
+    def rows(self):
+        names = self.staff_names()
+        for timelog in TimeLogModel.iter_timelog(fields = ["id", "staff_id", "clock_in", "clock_out", "updated_at"], date_from = self.date_from, date_to = self.date_to, staff_ids = self.staff_ids, batch_size = self.batch_size):
+            clock_in, clock_out = timelog["clock_in"], timelog["clock_out"]
+            yield (timelog["id"], timelog["staff_id"], names.get(timelog["staff_id"]), clock_in, clock_out,
+                   round((clock_out - clock_in).total_seconds() / 3600, 2) if clock_in and clock_out else None, timelog["updated_at"])
+
+
+    @staticmethod
+    def serialize(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return value
+
+
+    def lines(self):
+        if self.export_format == "csv":
+            buffer = RowBuffer()
+            writer = csv.writer(buffer)
+            writer.writerow(self.FIELDS)
+            yield buffer.drain()
+            for row in self.rows():
+                writer.writerow([self.serialize(value) for value in row])
+                yield buffer.drain()
+        else:
+            fields = self.FIELDS
+            for row in self.rows():
+                yield json.dumps(dict(zip(fields, (self.serialize(value) for value in row)))) + "\n"
+
+
+    def stream(self):
+        """Yields the export in chunks of about chunk_size bytes, apart from the first line and the end of the first batch which are yielded right away."""
+        early = {0, self.batch_size if self.export_format == "csv" else self.batch_size - 1}
+        chunk = []
+        size = 0
+        for count, line in enumerate(self.lines()):
+            chunk.append(line)
+            size += len(line)
+            if size >= self.chunk_size or count in early:
+                yield "".join(chunk)
+                chunk.clear()
+                size = 0
+        if chunk:
+            yield "".join(chunk)
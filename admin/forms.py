@@ -1,4 +1,3 @@
-import base64
 from uuid import uuid4
 from string import ascii_lowercase
 from flask_wtf import FlaskForm
@@ -8,11 +7,11 @@ from wtforms.widgets import HiddenInput
 from werkzeug.datastructures import ImmutableMultiDict
 from datetime import datetime
 from random import choices
-from io import BytesIO
 from dateutil import parser as dateutilparser
 from werkzeug.datastructures import FileStorage
 from flask_login import current_user
 from utils.utilities import FormUtil, ImageUtil
+from utils.errors import FormValidationError
 from utils.consts import GenderEnum, ShiftEnum, DayEnum
 
 
@@ -202,7 +201,26 @@ class StaffForm(FlaskForm):
 
 
 
+class StaffImportForm(FlaskForm):
+    max_file_size = 10
+    file = FileField(label="staff csv", name="file")
+    submit = SubmitField(label="import")
+
+
+    def validate_after_submit(self, errors = "coerce"):
+        try:
+            formutil = FormUtil()
+            formutil.fileext(field=self.file, exts=['csv'], filereq=True, error=errors)
+            formutil.filesize(field=self.file, size=self.max_file_size, filereq=True, error=errors)
+            return all(formutil._success)
+        except ValidationError:
+            return False
+
+
+
+
 class TimeLogForm(FlaskForm):
+    max_picture_size = 5
     id = IntegerField(label="staff id", validators=[Optional()], name="id", render_kw={'disabled':'disabled'} , widget=HiddenInput())
     clock_in = DateTimeField(label="clock in", validators=[Optional()], name = "clock_in")
     clock_out = DateTimeField(label="clock out", validators=[Optional()], name = "clock_out")
@@ -229,12 +247,14 @@ class TimeLogForm(FlaskForm):
 
     def validate_on_submit(self, request, extra_validators=None, errors = "coerce"):
         formreqdata = {**request.form, **request.files}
+        pictureerror = None
         if formreqdata.get("picture")!="undefined" and bool(formreqdata.get("picture")):
-            image_ext = (formreqdata['picture'][:23].rsplit(";",1)[0]).rsplit("/",1)[-1]
-            base64_string = ImageUtil. add_required_padding(formreqdata['picture'].split(',')[1])
-            decoded_image = BytesIO(base64.decodebytes(bytes(base64_string, "utf-8")))
-            file_storage = FileStorage(stream=decoded_image, filename=f"clock_in_photo.{image_ext}", content_type=f"image/{image_ext}")
-            formreqdata["picture"] = file_storage
+            try:
+                decoded_image, image_ext, image_size = ImageUtil.decode_data_url(formreqdata['picture'], max_size = self.max_picture_size * 1000 * 1000)
+                formreqdata["picture"] = FileStorage(stream=decoded_image, filename=f"clock_in_photo.{image_ext}", content_type=f"image/{image_ext}", content_length=image_size)
+            except FormValidationError as fve:
+                pictureerror = str(fve)
+                formreqdata.pop("picture",None)
         else:
             formreqdata.pop("picture",None)
         
@@ -246,4 +266,8 @@ class TimeLogForm(FlaskForm):
         
         formdata = ImmutableMultiDict(formreqdata)
         self.process(formdata=formdata)
-        return super().validate_on_submit(extra_validators)
\ No newline at end of file
+        validateresp = super().validate_on_submit(extra_validators)
+        if pictureerror:
+            self.picture.errors = [*self.picture.errors, pictureerror]
+            return False
+        return validateresp
@@ -0,0 +1,143 @@
+import csv
+from uuid import uuid4
+from random import choices
+from string import ascii_lowercase
+from datetime import datetime
+from werkzeug.datastructures import MultiDict
+from sqlalchemy import or_ as sqlalchemyor
+from admin.forms import StaffForm
+from admin.models import db, StaffModel, ScheduleModel
+from utils.utilities import Logger
+
+
+
+logger = Logger.getLogger(sub_name="admin: Importer")
+
+
+
+class StaffImporter:
+    """Bulk imports staff from a CSV file.
+
+    Every row is validated with the StaffForm rules, aadhar/email/registration
+    id duplicates are looked up with one query per batch and the valid rows are
+    inserted with a single executemany per batch, one transaction each. Rows
+    that fail are collected in errors (line, {field: messages}) and the rest of
+    the file is still imported.
+    """
+
+    COLUMNS = ("name", "gender", "dob", "email", "mobile", "alternate_mobile", "aadhar", "address", "pincode", "city", "role", "schedule", "registration_id", "registration_date", "password")
+    REQUIRED_COLUMNS = ("name", "gender", "dob", "email", "mobile", "aadhar", "address", "pincode", "city")
+    MAX_REPORTED_ERRORS = 200
+
+    def __init__(self, batch_size = 500, allow_managers = True):
+        self.batch_size = batch_size
+        self.allow_managers = allow_managers
+        self.form = StaffForm(meta = {"csrf": False}, formdata = None)
+        self.form.schedule.choices = []
+        self.schedule_ids = None
+        self.seen = {"aadhar": set(), "email": set(), "registration_id": set()}
+        self.imported = 0
+        self.errors = []
+
+
+    def formdata(self, row):
+        """Maps a CSV row onto the StaffForm input names, filling the generated fields like AddStaff does."""
+        form = self.form
+        row = {column: (row.get(column) or "").strip() for column in self.COLUMNS}
+        row["registration_id"] = row["registration_id"] or uuid4().hex
+        row["password"] = row["password"] or ''.join(choices(ascii_lowercase, k=10))
+        row["registration_date"] = row["registration_date"] or datetime.now().date().isoformat()
+        row["role"] = row["role"].capitalize() if row["role"] and self.allow_managers else "Employee"
+        return MultiDict({getattr(form, column).name: value for column, value in row.items() if value})
+
+
+    def validate(self, line, row):
+        form = self.form
+        form.process(formdata = self.formdata(row))
+        valid = form.validate() and form.validate_after_submit(errors = "coerce")
+        errors = {field: errors for field, errors in form.errors.items() if errors}
+        errors.update({column: ["This field is required."] for column in self.REQUIRED_COLUMNS if not getattr(form, column).data and column not in errors})
+        if not valid or errors:
+            self.errors.append((line, errors))
+            return None
+
+        data = {column: getattr(form, column).data for column in self.COLUMNS if column not in ("role", "schedule")}
+        data["is_manager"] = form.role.data == "Manager"
+        data["schedule_id"] = None
+        if form.schedule.data:
+            if self.schedule_ids is None:
+                self.schedule_ids = {schedule_id for (schedule_id,) in db.session.query(ScheduleModel.id)}
+            if not form.schedule.data.isdigit() or int(form.schedule.data) not in self.schedule_ids:
+                self.errors.append((line, {"schedule": ["Schedule doesn't exists"]}))
+                return None
+            data["schedule_id"] = int(form.schedule.data)
+
+        for field in self.seen:
+            if data[field] in self.seen[field]:
+                self.errors.append((line, {field: [f"{field} is repeated in the file"]}))
+                return None
+        for field in self.seen:
+            self.seen[field].add(data[field])
+        return data
+
+
+    def find_duplicates(self, batch):
+        """Returns the aadhar, email and registration ids of the batch that are already registered, in one query."""
+        values = {field: [data[field] for _, data in batch] for field in self.seen}
+        existing = (db.session.query(StaffModel.aadhar, StaffModel.email, StaffModel.registration_id)
+                              .filter(sqlalchemyor(StaffModel.aadhar.in_(values["aadhar"]), StaffModel.email.in_(values["email"]), StaffModel.registration_id.in_(values["registration_id"])))
+                              .all())
+        return {field: {getattr(staff, field) for staff in existing} for field in self.seen}
+
+
+    def insert(self, batch):
+        existing = self.find_duplicates(batch)
+        rows = []
+        for line, data in batch:
+            duplicate = next((field for field in self.seen if data[field] in existing[field]), None)
+            if duplicate:
+                self.errors.append((line, {duplicate: [f"{duplicate.capitalize()} is already registered to the other staff member"]}))
+            else:
+                rows.append((line, data))
+        if not rows:
+            return
+
+        try:
+            db.session.execute(StaffModel.__table__.insert(), [data for _, data in rows])
+            db.session.commit()
+            self.imported += len(rows)
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Bulk insert of {len(rows)} staff failed ({e}), retrying row by row")
+            for line, data in rows:
+                try:
+                    db.session.execute(StaffModel.__table__.insert(), data)
+                    db.session.commit()
+                    self.imported += 1
+                except Exception as e:
+                    db.session.rollback()
+                    self.errors.append((line, {"row": [str(getattr(e, "orig", e))]}))
+
+
+    def run(self, fileobj):
+        """Imports the staff of an open text CSV file and returns (imported, errors)."""
+        logger.info("Attempting to import staff in TimeScale")
+        reader = csv.DictReader(fileobj)
+        missing = [column for column in self.REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            self.errors.append((1, {"header": [f"Missing columns: {', '.join(missing)}"]}))
+            return self.imported, self.errors
+
+        batch = []
+        for line, row in enumerate(reader, start = 2):
+            data = self.validate(line, row)
+            if data is not None:
+                batch.append((line, data))
+            if len(batch) >= self.batch_size:
+                self.insert(batch)
+                batch = []
+        if batch:
+            self.insert(batch)
+
+        logger.info(f"Successfully imported {self.imported} staff in TimeScale with {len(self.errors)} failed rows")
+        return self.imported, self.errors
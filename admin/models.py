@@ -1,20 +1,59 @@
 import os
+import threading
+import shutil
+import mimetypes
+from io import BytesIO
+from time import monotonic, sleep
+from collections import namedtuple
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import UserMixin
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
 from werkzeug.utils import secure_filename
-from sqlalchemy import desc as sqlalchemydesc, or_ as sqlalchemyor
+from sqlalchemy import event, desc as sqlalchemydesc, or_ as sqlalchemyor, and_ as sqlalchemyand
 from werkzeug.datastructures import FileStorage
-from utils.utilities import BaseUtil, ModelUtil, Logger, MinioDB
+from utils.utilities import BaseUtil, ModelUtil, Logger, MinioDB, WorkerPool, GroupCommitWriter, ImageUtil, TTLCache, Projection, RoutingSession
 from utils.errors import MemberNotFoundError
+from utils.consts import DayEnum
 
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options = {"class_": RoutingSession})
 migrate = Migrate(db = db)
 minio = MinioDB()
+uploader = WorkerPool("uploader", max_workers = int(os.getenv("UPLOAD_WORKERS", 4)), max_queue = int(os.getenv("UPLOAD_QUEUE_SIZE", 256)))
+timelog_writer = GroupCommitWriter("timelog_writer", handler = lambda items: TimeLogModel.clock_batch(items), interval = int(os.getenv("TIMELOG_COMMIT_INTERVAL_MS", 5)) / 1000,
+                                   max_batch = int(os.getenv("TIMELOG_COMMIT_BATCH", 64)), max_queue = int(os.getenv("TIMELOG_COMMIT_QUEUE", 1024)))
 logger = Logger.getLogger(sub_name="admin: Model")
+principal_cache = TTLCache(maxsize = int(os.getenv("USER_CACHE_SIZE", 4096)), ttl = int(os.getenv("USER_CACHE_TTL", 60)))
+schedule_cache = TTLCache(maxsize = int(os.getenv("SCHEDULE_CACHE_SIZE", 1024)), ttl = int(os.getenv("SCHEDULE_CACHE_TTL", 300)))
+
+
+
+class Principal(namedtuple("Principal", ["id", "name", "is_admin", "is_manager", "schedule_id"]), UserMixin):
+    """Immutable identity of the logged in admin/staff kept in principal_cache instead of the ORM row."""
+
+    __slots__ = ()
+    models = {}
+
+
+    @classmethod
+    def load(cls, user_type, user_id):
+        return principal_cache.get_or_set((user_type, user_id), lambda: cls.from_model(db.session.get(cls.models[user_type], user_id), is_admin = (user_type == "admin")))
+
+
+    @classmethod
+    def from_model(cls, user, is_admin = False):
+        if user is None:
+            return None
+        return cls(id = user.id, name = user.name, is_admin = is_admin, is_manager = bool(getattr(user, "is_manager", False)), schedule_id = getattr(user, "schedule_id", None))
+
+
+    @staticmethod
+    def invalidate(user_type, user_id):
+        principal_cache.invalidate((user_type, int(user_id)))
 
 
 class AdminModel(db.Model, UserMixin):
@@ -55,7 +94,7 @@ class StaffModel(db.Model, UserMixin):
     registration_id = db.Column(db.String(100), nullable=False, unique = True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(155), nullable=False)
-    dob = db.Column(db.DateTime, nullable=False, default = datetime.utcnow())
+    dob = db.Column(db.DateTime, nullable=False, default = datetime.utcnow)
     gender = db.Column(db.String(6), nullable=False)
     mobile = db.Column(db.String(15), nullable=False)
     alternate_mobile = db.Column(db.String(15), nullable=True)
@@ -64,12 +103,21 @@ class StaffModel(db.Model, UserMixin):
     pincode = db.Column(db.Integer, nullable = False)
     city = db.Column(db.String(100), nullable = False)
     picture = db.Column(db.Integer, db.ForeignKey('files.id', ondelete='CASCADE'), nullable = True)
-    registration_date = db.Column(db.DateTime, nullable = False, default = datetime.utcnow())
+    registration_date = db.Column(db.DateTime, nullable = False, default = datetime.utcnow)
     aadhar = db.Column(db.String(15), nullable=False, unique = True)
-    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow())
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow, onupdate = datetime.utcnow)
     is_manager = db.Column(db.Boolean, nullable = False, default = False)
     schedule_id = db.Column(db.Integer, db.ForeignKey('schedule.id'), nullable=True)
     timelogs = db.relationship('TimeLogModel', backref='staff', lazy=True, cascade="all,delete" , passive_deletes=True, uselist = True)
+    attendance = db.relationship('DailyAttendanceModel', lazy=True, cascade="all,delete" , passive_deletes=True, uselist = True)
+
+    __table_args__ = (
+        db.Index("ix_staff_name_id", "name", "id"),
+        db.Index("ix_staff_registration_date_id", "registration_date", "id"),
+    )
+
+    SORTABLE_FIELDS = ("id", "name", "registration_date")
+    LISTING_FIELDS = ("id", "name", "registration_id", "registration_date", "gender", "dob", "email", "mobile", "alternate_mobile", "aadhar", "address", "pincode", "city", "password", "updated_at", "schedule_id", "is_manager")
 
 
     @classmethod
@@ -82,7 +130,7 @@ class StaffModel(db.Model, UserMixin):
             kwargs["is_manager"] = (kwargs.pop("role", None)=="Manager")
 
             if bool(kwargs.get("picture")):
-                kwargs["picture"] = FilesModel.add_file(file = kwargs.pop("picture"), bucket = "images")
+                kwargs["picture"] = FilesModel.add_file(file = kwargs.pop("picture"), bucket = "images", background = True)
             else:
                 kwargs.pop("picture", None)
 
@@ -116,8 +164,10 @@ class StaffModel(db.Model, UserMixin):
             if staff is None:
                 raise MemberNotFoundError(memberparam = staffkey, memberparamval=kwargs[staffkey], membertype="Staff")
             
+            staff_id = staff.id
             db.session.delete(staff)
             db.session.commit()
+            Principal.invalidate("staff", staff_id)
             logger.info(f"Successfully deleted staff: {kwargs[staffkey]} in TimeScale")
         
         except Exception as e:
@@ -148,7 +198,7 @@ class StaffModel(db.Model, UserMixin):
                 return
 
             if bool(kwargs.get("picture")):
-                kwargs["picture"] = FilesModel.add_file(file = kwargs["picture"], bucket = "images")
+                kwargs["picture"] = FilesModel.add_file(file = kwargs["picture"], bucket = "images", background = True)
             else:
                 kwargs.pop("picture",None)
                 
@@ -164,7 +214,9 @@ class StaffModel(db.Model, UserMixin):
                 if hasattr(staff,param):
                     setattr(staff,param,kwargs[param])
 
+            staff_id = staff.id
             db.session.commit()
+            Principal.invalidate("staff", staff_id)
 
             logger.info("Successfully updated student in TimeScale")
         
@@ -186,18 +238,14 @@ class StaffModel(db.Model, UserMixin):
             if not kwargs:
                 return {}
 
-            if first_only:
-                if filter_cond=="and":
-                    staff = StaffModel.query.filter_by(**kwargs).first()
-                else:
-                    staff = StaffModel.query.filter(sqlalchemyor(*[getattr(StaffModel, k) == v for k, v in kwargs.items() if hasattr(StaffModel, k)])).first()
-            else:
-                if filter_cond=="and":
-                    staff = StaffModel.query.filter_by(**kwargs).all()
-                else:
-                    staff = StaffModel.query.filter(sqlalchemyor(*[getattr(StaffModel, k) == v for k, v in kwargs.items() if hasattr(StaffModel, k)])).all()
+            projection = Projection.compile({"staff": (StaffModel, fields)})
+            conditions = [getattr(StaffModel, k) == v for k, v in kwargs.items() if hasattr(StaffModel, k)]
+            staff = projection.query(db.session).filter(sqlalchemyand(*conditions) if filter_cond=="and" else sqlalchemyor(*conditions))
+
             logger.info("Successfully fetch staff in TimeScale")
-            return ModelUtil.parse_model_fields(modeldata = staff, fields = fields)
+            if first_only:
+                return projection.parse_one(staff.first())
+            return projection.parse(staff.all())
     
         except Exception as e:
             logger.error("Failed to fetch staff in TimeScale")
@@ -206,29 +254,63 @@ class StaffModel(db.Model, UserMixin):
 
 
     @staticmethod
+    @ModelUtil.on_replica(db)
     def list_staff(**kwargs):
             
             get_references = kwargs.pop("get_references", False)
+            page_size = kwargs.pop("page_size", None)
+            pagination = {"cursor": kwargs.pop("cursor", None), "sort_by": kwargs.pop("sort_by", "id"), "sort_order": kwargs.pop("sort_order", "asc"), "sortable": StaffModel.SORTABLE_FIELDS}
+            next_cursor = None
             logger.info("Attempting to list staff in TimeScale")
             
             if get_references:
-                
-                staff = (db.session.query(StaffModel,FilesModel)
-                                  .join(FilesModel, StaffModel.picture == FilesModel.id, isouter=True).all())
- 
-                logger.info("Successfully list staff in TimeScale")
-
-                return ModelUtil.parse_join_fields(staff,
-                                                    aliases = ["staff","picture"],
-                                                    fetchedkeys = {"staff": ["id","name","registration_id","registration_date","gender","dob","email","mobile","alternate_mobile","aadhar","address","pincode","city","password","qualifications","about","subjects","role","updated_at","schedule_id","is_manager"],
-                                                                    "picture": ["file_uri", "file_name", "bucket_name","file_path","file_type","expired_at","created_at","id"],
-                                                                  },
-                                                    renames = {"picture": {"file_uri":"picture", "file_name": "picture_name", "bucket_name": "picture_bucket_name", "file_path": "picture_file_path", "file_type":"picture_file_type", "expired_at": "picture_expired_at", "created_at": "picture_created_at", "id": "picture_id"}}
-                                                    )
+                projection = Projection.compile({"staff": (StaffModel, StaffModel.LISTING_FIELDS), "picture": (FilesModel, FilesModel.REFERENCE_FIELDS)}, renames = {"picture": FilesModel.REFERENCE_RENAMES})
+                staff = (projection.query(db.session).select_from(StaffModel)
+                                  .join(FilesModel, StaffModel.picture == FilesModel.id, isouter=True))
+            else:
+                projection = Projection.compile({"staff": (StaffModel, None)})
+                staff = projection.query(db.session)
+
+            if page_size:
+                staff, next_cursor = ModelUtil.keyset_paginate(staff, StaffModel, page_size = page_size, **pagination)
             else:
-                staff = StaffModel.query.all()
-                logger.info("Successfully list staff in TimeScale")
-                return ModelUtil.parse_model_fields(modeldata = staff, fields = None)
+                staff = staff.all()
+            logger.info("Successfully list staff in TimeScale")
+
+            staff = projection.parse(staff)
+            if get_references:
+                FilesModel.sign_links(staff)
+
+            if page_size:
+                return staff, next_cursor
+            return staff
+
+
+
+    @staticmethod
+    @ModelUtil.on_replica(db)
+    def iter_staff(get_references = False, batch_size = 1000):
+        """Generator variant of list_staff, yields the staff one at a time in id order."""
+        logger.info("Attempting to stream staff in TimeScale")
+        if get_references:
+            projection = Projection.compile({"staff": (StaffModel, StaffModel.LISTING_FIELDS), "picture": (FilesModel, FilesModel.REFERENCE_FIELDS)}, renames = {"picture": FilesModel.REFERENCE_RENAMES})
+            query = (projection.query(db.session).select_from(StaffModel)
+                              .join(FilesModel, StaffModel.picture == FilesModel.id, isouter=True))
+        else:
+            projection = Projection.compile({"staff": (StaffModel, None)})
+            query = projection.query(db.session)
+
+        for batch in ModelUtil.iter_batches(query.order_by(StaffModel.id), batch_size):
+            staff = projection.parse(batch)
+            if get_references:
+                FilesModel.sign_links(staff)
+            yield from staff
+        logger.info("Successfully streamed staff in TimeScale")
+
+
+
+
+Principal.models.update({"admin": AdminModel, "staff": StaffModel})
 
 
 
@@ -243,9 +325,15 @@ class ScheduleModel(db.Model):
     shift_type = db.Column(db.String(10), nullable=False)
     shift_start = db.Column(db.Time, nullable = False)
     shift_ends = db.Column(db.Time, nullable = False)
-    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow())
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow, onupdate = datetime.utcnow)
     dayoffs = db.relationship('WeekOffModel', backref='staff', lazy=True, cascade="all,delete" , passive_deletes=True, uselist = True)
 
+    __table_args__ = (
+        db.Index("ix_schedule_name_id", "name", "id"),
+    )
+
+    SORTABLE_FIELDS = ("id", "name")
+
 
     @classmethod
     def add_schedule(cls, **kwargs):
@@ -261,6 +349,7 @@ class ScheduleModel(db.Model):
                 schedule.dayoffs.append(doff)
             db.session.add(schedule)
             db.session.commit()
+            ScheduleModel.invalidate_cache()
             logger.info(f"Successfully added schedule in TimeScale")
         
         except Exception as e:
@@ -303,6 +392,7 @@ class ScheduleModel(db.Model):
                     setattr(schedule,param,kwargs[param])
 
             db.session.commit()
+            ScheduleModel.invalidate_cache()
 
             logger.info("Successfully updated schedule in TimeScale")
         
@@ -324,13 +414,17 @@ class ScheduleModel(db.Model):
             if not kwargs:
                 return {}
 
+            query = ScheduleModel.query.filter_by(**kwargs)
+            if get_references:
+                query = ModelUtil.eager_load(query, ScheduleModel, ["dayoffs"])
+
             if first_only:
-                schedule = ScheduleModel.query.filter_by(**kwargs).first()
+                schedule = query.first()
                 logger.info("Successfully fetch schedule in TimeScale")
                 if get_references:
                     return ModelUtil.parse_model_fields(modeldata = schedule, fields = None, relationship_info={"relationship": ["dayoffs"], "fields": ["name"], "value_only": True})    
             else:
-                schedule = ScheduleModel.query.filter_by(**kwargs).all()
+                schedule = query.all()
                 logger.info("Successfully fetch schedule in TimeScale")
                 if get_references:
                     return ModelUtil.parse_model_fields(modeldata = schedule, fields = None, relationship_info={"relationship": ["dayoffs"], "fields": ["name"], "value_only": True})    
@@ -346,21 +440,58 @@ class ScheduleModel(db.Model):
 
 
     @staticmethod
+    @ModelUtil.on_replica(db)
     def list_schedule(**kwargs):
             get_references = kwargs.pop("get_references", False)
+            page_size = kwargs.pop("page_size", None)
+            pagination = {"cursor": kwargs.pop("cursor", None), "sort_by": kwargs.pop("sort_by", "id"), "sort_order": kwargs.pop("sort_order", "asc"), "sortable": ScheduleModel.SORTABLE_FIELDS}
+            next_cursor = None
             logger.info("Attempting to list schedule in TimeScale")
             
+            query = ModelUtil.eager_load(ScheduleModel.query, ScheduleModel, ["dayoffs"]) if get_references else ScheduleModel.query
+            if page_size:
+                schedules, next_cursor = ModelUtil.keyset_paginate(query, ScheduleModel, page_size = page_size, **pagination)
+            else:
+                schedules = query.all()
+            logger.info("Successfully list schedule in TimeScale")
 
             if get_references:
-                schedules = ScheduleModel.query.all()
-                logger.info("Successfully list schedule in TimeScale")
-                return ModelUtil.parse_model_fields(modeldata = schedules, fields = None, relationship_info={"relationship": ["dayoffs"], "fields": ["name"], "value_only": True})
-            
+                schedules = ModelUtil.parse_model_fields(modeldata = schedules, fields = None, relationship_info={"relationship": ["dayoffs"], "fields": ["name"], "value_only": True})
             else:
-                schedules = ScheduleModel.query.all()
-                logger.info("Successfully list schedule in TimeScale")
-                return ModelUtil.parse_model_fields(modeldata = schedules, fields = None)
+                schedules = ModelUtil.parse_model_fields(modeldata = schedules, fields = None)
+
+            if page_size:
+                return schedules, next_cursor
+            return schedules
+
+
+
+    @staticmethod
+    @ModelUtil.on_replica(db)
+    def iter_schedule(get_references = False, batch_size = 1000):
+        """Generator variant of list_schedule, yields the schedules one at a time in id order."""
+        logger.info("Attempting to stream schedule in TimeScale")
+        query = ScheduleModel.query.order_by(ScheduleModel.id)
+        if get_references:
+            query = ModelUtil.eager_load(query, ScheduleModel, ["dayoffs"])
+        relationship_info = {"relationship": ["dayoffs"], "fields": ["name"], "value_only": True} if get_references else {}
 
+        for batch in ModelUtil.iter_batches(query, batch_size):
+            yield from ModelUtil.parse_model_fields(modeldata = batch, fields = None, relationship_info = relationship_info)
+        logger.info("Successfully streamed schedule in TimeScale")
+
+
+
+    @staticmethod
+    def list_schedule_choices():
+        """Returns the cached (id, label) pairs of all schedules for select fields."""
+        return schedule_cache.get_or_set("choices", lambda: [(schedule['id'], f"{schedule['name']} ({schedule['shift_start']} - {schedule['shift_ends']})") for schedule in ScheduleModel.list_schedule()])
+
+
+    @staticmethod
+    def invalidate_cache():
+        schedule_cache.invalidate("choices")
+        shift_calendar.invalidate()
 
 
     @classmethod
@@ -375,6 +506,7 @@ class ScheduleModel(db.Model):
             
             db.session.delete(staff)
             db.session.commit()
+            ScheduleModel.invalidate_cache()
             logger.info(f"Successfully deleted staff: {kwargs['id']} in TimeScale")
         
         except Exception as e:
@@ -391,7 +523,7 @@ class WeekOffModel(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(10), nullable=False)
     schedule_id = db.Column(db.Integer, db.ForeignKey('schedule.id'), nullable=False)
-    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow())
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow, onupdate = datetime.utcnow)
 
 
 
@@ -406,11 +538,151 @@ class OffDayModel(db.Model):
     is_half_day = db.Column(db.Boolean, nullable = False, default = False)
     staff_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=False)
     day_of_week = db.Column(db.String(10), nullable=False)
-    requested_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow())
-    approved_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow())
+    requested_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow)
+    approved_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow)
     approver_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=False)
-    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow())
-    
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow, onupdate = datetime.utcnow)
+
+
+
+
+class ShiftCalendar:
+    """Answers whether a staff member is expected to work on a day without touching the database.
+
+    Keeps, per schedule, a 7 bit weekday bitmap of working days (bit 0 is
+    monday) with its shift start/end, and per staff a bitmap of the full off
+    days in a rolling window of days around today (bit i is window_start + i).
+    It is rebuilt lazily after invalidate() (schedule writes and committed
+    off day writes call it), once it is older than ttl seconds (catching
+    bulk writes that bypass the ORM), or when today nears the end of the
+    window. Half day offs are still expected
+    working days.
+
+    It is also the per schedule shift and week off cache of the clock-in
+    path: lookups answered from the built calendar count as hits, the ones
+    that had to (re)build it or query an off day outside the window as
+    misses.
+    """
+
+    Snapshot = namedtuple("Snapshot", ["window_start", "schedules", "offdays"])
+
+    def __init__(self, window_days = 90, ttl = 300):
+        self.window_days = window_days
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.generation = 0
+        self.snapshot = ShiftCalendar.Snapshot(None, {}, {})
+        self.builds = 0
+        self.hits = 0
+        self.misses = 0
+        self.counts_lock = threading.Lock()
+
+
+    def build(self, today):
+        """Builds the calendar into locals and publishes it as one snapshot, so readers never mix the bitmaps of one build with the window of another."""
+        generation = self.generation
+        window_start = today - timedelta(days = self.window_days)
+        window_end = today + timedelta(days = self.window_days)
+
+        schedules = {schedule_id: [0b1111111, shift_start, shift_ends] for schedule_id, shift_start, shift_ends in db.session.query(ScheduleModel.id, ScheduleModel.shift_start, ScheduleModel.shift_ends)}
+        weekdays = [day.value for day in DayEnum]
+        for schedule_id, name in db.session.query(WeekOffModel.schedule_id, WeekOffModel.name):
+            if schedule_id in schedules and name in weekdays:
+                schedules[schedule_id][0] &= ~(1 << weekdays.index(name))
+
+        offdays = {}
+        for staff_id, day in (db.session.query(OffDayModel.staff_id, OffDayModel.date)
+                                        .filter(OffDayModel.date >= window_start, OffDayModel.date <= window_end, OffDayModel.is_half_day.is_(False))):
+            offdays[staff_id] = offdays.get(staff_id, 0) | (1 << (day - window_start).days)
+
+        self.snapshot = ShiftCalendar.Snapshot(window_start, {schedule_id: tuple(schedule) for schedule_id, schedule in schedules.items()}, offdays)
+        # an invalidate() that raced the build keeps the new snapshot stale
+        self.loaded_at = monotonic() if generation == self.generation else None
+        self.builds += 1
+
+
+    def ensure(self, today = None):
+        """Rebuilds the calendar when it is stale, returns the current snapshot and whether it was rebuilt."""
+        today = today or date.today()
+        def stale():
+            window_start = self.snapshot.window_start
+            return (self.loaded_at is None or monotonic() - self.loaded_at > self.ttl
+                    or not (window_start <= today < window_start + timedelta(days = 2 * self.window_days)))
+        if stale():
+            with self.lock:
+                if stale():
+                    self.build(today)
+                    return self.snapshot, True
+        return self.snapshot, False
+
+
+    def invalidate(self):
+        self.generation += 1
+        self.loaded_at = None
+
+
+    def count(self, hit):
+        with self.counts_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+    def shift(self, schedule_id):
+        """Returns (shift_start, shift_ends) of the schedule or None."""
+        snapshot, rebuilt = self.ensure()
+        self.count(not rebuilt)
+        schedule = snapshot.schedules.get(schedule_id)
+        return schedule[1:] if schedule else None
+
+
+    def is_expected(self, staff_id, schedule_id, day = None):
+        """True when the staff member's schedule has a shift on day (today by default) and it isn't an off day of theirs."""
+        day = day or date.today()
+        snapshot, rebuilt = self.ensure()
+        schedule = snapshot.schedules.get(schedule_id)
+        if schedule is None or not (schedule[0] >> day.weekday()) & 1:
+            self.count(not rebuilt)
+            return False
+
+        offset = (day - snapshot.window_start).days
+        if 0 <= offset < 2 * self.window_days + 1:
+            self.count(not rebuilt)
+            return not (snapshot.offdays.get(staff_id, 0) >> offset) & 1
+        self.count(False)
+        return not db.session.query(OffDayModel.query.filter_by(staff_id = staff_id, date = day, is_half_day = False).exists()).scalar()
+
+
+    def stats(self):
+        snapshot = self.snapshot
+        return {"schedules": len(snapshot.schedules), "staff_with_offdays": len(snapshot.offdays), "window_start": str(snapshot.window_start), "window_days": self.window_days, "builds": self.builds, "hits": self.hits, "misses": self.misses}
+
+
+
+shift_calendar = ShiftCalendar(window_days = int(os.getenv("CALENDAR_WINDOW_DAYS", 90)), ttl = int(os.getenv("CALENDAR_TTL", 300)))
+
+
+
+@event.listens_for(OffDayModel, "after_insert")
+@event.listens_for(OffDayModel, "after_update")
+@event.listens_for(OffDayModel, "after_delete")
+def offday_written(mapper, connection, target):
+    """Flags the flushing session, the calendar is invalidated once its off day writes commit."""
+    db.object_session(target).info["offdays_written"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def invalidate_shift_calendar(session):
+    if session.info.pop("offdays_written", False):
+        shift_calendar.invalidate()
+
+
+@event.listens_for(RoutingSession, "after_soft_rollback")
+def discard_offday_writes(session, previous_transaction):
+    session.info.pop("offdays_written", None)
+
 
 
 
@@ -423,7 +695,21 @@ class TimeLogModel(db.Model):
     clock_out = db.Column(db.DateTime, nullable=True)
     picture = db.Column(db.Integer, db.ForeignKey('files.id', ondelete='CASCADE'), nullable = True)
     staff_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=False)
-    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow())
+    work_date = db.Column(db.Date, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow, onupdate = datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_timelogs_staff_id_clock_in", "staff_id", "clock_in"),
+        db.Index("ix_timelogs_staff_id_updated_at", "staff_id", "updated_at"),
+        db.Index("ix_timelogs_clock_in_id", "clock_in", "id"),
+        db.UniqueConstraint("staff_id", "work_date", name="uq_timelogs_staff_id_work_date"),
+    )
+
+    SORTABLE_FIELDS = ("clock_in", "id")
+    REFERENCE_FIELDS = ("id", "clock_in", "clock_out", "updated_at", "staff_id")
+    group_commit = bool(int(os.getenv("TIMELOG_GROUP_COMMIT", 1)))
+    CLOCK_FIELDS = ("clock_in", "clock_out", "picture")
+    group_commit_timeout = 30
 
 
     @classmethod
@@ -434,15 +720,18 @@ class TimeLogModel(db.Model):
             BaseUtil.perform_argument_check(data = kwargs,requiredargs = ["staff_id"], callback_name = "TimelogModel.add_timelog")
             
             if bool(kwargs.get("picture")):
-                kwargs["picture"] = FilesModel.add_file(file = kwargs["picture"], bucket = "images")
+                kwargs["picture"] = FilesModel.add_file(file = kwargs["picture"], bucket = "images", background = True)
             else:
                 kwargs.pop("picture",None)
 
             cols = cls.__table__.columns.keys()
             timelog = cls(**ModelUtil.parse_kwargs(kwargs, cols))
+            timelog.work_date = cls.get_work_date(timelog.clock_in)
             db.session.add(timelog)
+            DailyAttendanceModel.refresh_days(timelog.staff_id, timelog.clock_in)
             db.session.commit()
             logger.info(f"Successfully added timelog in TimeScale")
+            return timelog.id
         
         except Exception as e:
             db.session.rollback()
@@ -451,50 +740,118 @@ class TimeLogModel(db.Model):
 
 
     @staticmethod
+    @ModelUtil.on_replica(db)
+    def iter_timelog(fields = None, get_references = False, date_from = None, date_to = None, staff_ids = None, batch_size = 1000, **filters):
+        """Generator variant of fetch_timelog, yields the matching timelogs one at a time ordered by clock_in."""
+        logger.info("Attempting to stream timelogs in TimeScale")
+        conditions = [getattr(TimeLogModel, k) == v for k, v in filters.items() if hasattr(TimeLogModel, k)]
+        if staff_ids:
+            conditions.append(TimeLogModel.staff_id.in_(staff_ids))
+        if date_from:
+            conditions.append(TimeLogModel.clock_in >= datetime.combine(date_from, datetime.min.time()))
+        if date_to:
+            conditions.append(TimeLogModel.clock_in < datetime.combine(date_to, datetime.min.time()) + timedelta(days = 1))
+
+        projection, query = TimeLogModel.projected_query(get_references, fields)
+        query = query.filter(*conditions).order_by(TimeLogModel.clock_in, TimeLogModel.id)
+        for batch in ModelUtil.iter_batches(query, batch_size):
+            timelogs = projection.parse(batch)
+            if get_references:
+                FilesModel.sign_links(timelogs)
+            yield from timelogs
+        logger.info("Successfully streamed timelogs in TimeScale")
+
+
+    @staticmethod
+    def projected_query(get_references = False, fields = None):
+        """Returns (projection, query) of the timelog columns, joined to the picture file with get_references."""
+        if get_references:
+            projection = Projection.compile({"timelog": (TimeLogModel, TimeLogModel.REFERENCE_FIELDS), "picture": (FilesModel, FilesModel.REFERENCE_FIELDS)}, renames = {"picture": FilesModel.REFERENCE_RENAMES})
+            return projection, (projection.query(db.session).select_from(TimeLogModel)
+                                    .join(FilesModel, TimeLogModel.picture == FilesModel.id, isouter=True))
+        projection = Projection.compile({"timelog": (TimeLogModel, fields)})
+        return projection, projection.query(db.session)
+
+
+    @staticmethod
+    @ModelUtil.on_replica(db)
     def fetch_timelog(**kwargs):
         try:
             logger.info("Attempting to fetch timelogs in TimeScale")
             fields = kwargs.pop("fields", None)
             current = kwargs.pop("current", False)
             get_references = kwargs.pop("get_references", False)
+            date_from = kwargs.pop("date_from", None)
+            date_to = kwargs.pop("date_to", None)
+            page_size = kwargs.pop("page_size", None)
+            pagination = {"cursor": kwargs.pop("cursor", None), "sort_by": kwargs.pop("sort_by", "clock_in"), "sort_order": kwargs.pop("sort_order", "desc"), "sortable": TimeLogModel.SORTABLE_FIELDS}
             
             if not kwargs:
                 return {}
+
+            filters = [getattr(TimeLogModel, k) == v for k, v in kwargs.items() if hasattr(TimeLogModel, k)]
+            if date_from:
+                filters.append(TimeLogModel.clock_in >= datetime.combine(date_from, datetime.min.time()))
+            if date_to:
+                filters.append(TimeLogModel.clock_in < datetime.combine(date_to, datetime.min.time()) + timedelta(days = 1))
             
             if current:
-                if get_references:
-                    staff = (db.session.query(TimeLogModel,FilesModel)
-                                  .join(FilesModel, TimeLogModel.picture == FilesModel.id, isouter=True)
-                                  .filter(*[getattr(TimeLogModel, k) == v for k, v in kwargs.items() if hasattr(TimeLogModel, k)]).order_by(sqlalchemydesc(TimeLogModel.updated_at)).first())
-                    return ModelUtil.parse_join_fields(staff,
-                                    aliases = ["timelog","picture"],
-                                    fetchedkeys = {"timelog": ["id","clock_in","clock_out","picture","updated_at","staff_id"],
-                                                    "picture": ["file_uri", "file_name", "id"],
-                                                    },
-                                    renames = {"picture": {"file_uri":"picture", "file_name": "picture_name", "id": "picture_id"}}
-                                    )
-                staff = TimeLogModel.query.filter_by(**kwargs).order_by(sqlalchemydesc(TimeLogModel.updated_at)).first()  
+                if "staff_id" in kwargs and len(kwargs) == 1:
+                    return TimeLogModel.fetch_current_timelog(staff_id = kwargs["staff_id"], get_references = get_references, fields = fields)
+                with db.session().primary():
+                    projection, query = TimeLogModel.projected_query(get_references, fields)
+                    timelog = projection.parse_one(query.filter(*filters).order_by(sqlalchemydesc(TimeLogModel.updated_at), sqlalchemydesc(TimeLogModel.id)).first())
+                if get_references and timelog:
+                    FilesModel.sign_links([timelog])
+                logger.info("Successfully fetch timelogs in TimeScale")
+                return timelog
+
+            projection, query = TimeLogModel.projected_query(get_references, fields)
+            query = query.filter(*filters)
+            if page_size:
+                timelogs, next_cursor = ModelUtil.keyset_paginate(query, TimeLogModel, page_size = page_size, **pagination)
+            elif get_references:
+                timelogs = query.order_by(sqlalchemydesc(TimeLogModel.updated_at), sqlalchemydesc(TimeLogModel.id)).all()
             else:
-                if get_references:
-                    staff = (db.session.query(TimeLogModel,FilesModel)
-                                  .join(FilesModel, TimeLogModel.picture == FilesModel.id, isouter=True)
-                                  .filter(*[getattr(TimeLogModel, k) == v for k, v in kwargs.items() if hasattr(TimeLogModel, k)]).order_by(sqlalchemydesc(TimeLogModel.updated_at)).all())
-                    return ModelUtil.parse_join_fields(staff,
-                                    aliases = ["timelog","picture"],
-                                    fetchedkeys = {"timelog": ["id","clock_in","clock_out","picture","updated_at","staff_id"],
-                                                    "picture": ["file_uri", "file_name", "id"],
-                                                    },
-                                    renames = {"picture": {"file_uri":"picture", "file_name": "picture_name", "id": "picture_id"}}
-                                    )
-                staff = TimeLogModel.query.filter_by(**kwargs).all()
+                timelogs = query.all()
+
+            timelogs = projection.parse(timelogs)
+            if get_references:
+                FilesModel.sign_links(timelogs)
             logger.info("Successfully fetch timelogs in TimeScale")
-            return ModelUtil.parse_model_fields(modeldata = staff, fields = fields)
+            return (timelogs, next_cursor) if page_size else timelogs
     
         except Exception as e:
             logger.error("Failed to fetch timelogs in TimeScale")
             raise e
 
 
+    @staticmethod
+    def fetch_current_timelog(staff_id, open_only = False, get_references = False, fields = None):
+        """Fetches the latest (or latest open) timelog of a staff via an index seek on ix_timelogs_staff_id_clock_in.
+
+        Always read from the primary (even inside a replica() block): the staff
+        checks it right after clocking in or out, the replica may still lag.
+        """
+        try:
+            logger.info(f"Attempting to fetch current timelog of staff: {staff_id} in TimeScale")
+            filters = [TimeLogModel.staff_id == staff_id]
+            if open_only:
+                filters.append(TimeLogModel.clock_out.is_(None))
+
+            with db.session().primary():
+                projection, query = TimeLogModel.projected_query(get_references, fields)
+                timelog = projection.parse_one(query.filter(*filters).order_by(sqlalchemydesc(TimeLogModel.clock_in), sqlalchemydesc(TimeLogModel.id)).first())
+            if get_references and timelog:
+                FilesModel.sign_links([timelog])
+            logger.info(f"Successfully fetch current timelog of staff: {staff_id} in TimeScale")
+            return timelog
+
+        except Exception as e:
+            logger.error(f"Failed to fetch current timelog of staff: {staff_id} in TimeScale")
+            raise e
+
+
 
 
     @classmethod
@@ -515,17 +872,22 @@ class TimeLogModel(db.Model):
                 return
 
             if bool(kwargs.get("picture")):
-                kwargs["picture"] = FilesModel.add_file(file = kwargs["picture"], bucket = "images")
-
-            kwargs.pop("picture",None)
+                kwargs["picture"] = FilesModel.add_file(file = kwargs["picture"], bucket = "images", background = True)
+            else:
+                kwargs.pop("picture",None)
             
+            previous_clock_in = staff.clock_in
             for param in kwargs:
                 if hasattr(staff,param):
                     setattr(staff,param,kwargs[param])
+            if staff.clock_in != previous_clock_in:
+                staff.work_date = cls.get_work_date(staff.clock_in)
 
+            DailyAttendanceModel.refresh_days(staff.staff_id, previous_clock_in, staff.clock_in)
             db.session.commit()
 
             logger.info("Successfully updated timelog in TimeScale")
+            return staff.id
         
         except Exception as e:
             db.session.rollback()
@@ -533,6 +895,173 @@ class TimeLogModel(db.Model):
             raise e
         
 
+    @staticmethod
+    def get_work_date(clock_in):
+        """The day a timelog counts for: the day of its clock in, None without one (NULLs never collide in uq_timelogs_staff_id_work_date)."""
+        return clock_in.date() if isinstance(clock_in, datetime) else None
+
+
+    @classmethod
+    def clock_timelog(cls, staff_id, **kwargs):
+        """Clocks the staff in or out on the work day of clock_in, returns (timelog id, open).
+
+        A clock out without clock_in closes the staff's latest open timelog
+        (e.g. a night shift clocked in yesterday), today's without one.
+
+        open is True while the timelog has no clock out, i.e. the call was a
+        clock in. An idempotency_key (unique per staff) makes a retried call
+        return the result of the first one without writing anything. With
+        group_commit the write is queued on timelog_writer and committed
+        together with the other clock ins of the same few milliseconds; the
+        session is closed before waiting, so pending changes of the caller are
+        discarded and its loaded objects detached. A write still queued after
+        group_commit_timeout seconds is cancelled (never applied) before the
+        timeout is raised.
+        """
+        kwargs.pop("id", None)
+        key = kwargs.get("idempotency_key")
+        if key:
+            replay = ClockRequestModel.lookup({(staff_id, key)}).get((staff_id, key))
+            if replay is not None:
+                return replay
+
+        if bool(kwargs.get("picture")):
+            kwargs["picture"] = FilesModel.add_file(file = kwargs["picture"], bucket = "images", background = True)
+        else:
+            kwargs.pop("picture", None)
+
+        if cls.group_commit:
+            # the writer needs a pooled connection of its own, so the one this session
+            # holds since its first read (e.g. load_user) is returned before waiting
+            db.session.close()
+            timelog_writer.bind(current_app._get_current_object().app_context)
+            future = timelog_writer.submit((staff_id, kwargs))
+            if future is not None:
+                try:
+                    result = future.result(timeout = cls.group_commit_timeout)
+                except FutureTimeoutError:
+                    if future.cancel():
+                        raise
+                    # the batch holding it already started, its outcome is the call's
+                    result = future.result()
+                db.session().mark_written()
+                return result
+        return cls.clock_batch([(staff_id, kwargs)])[0]
+
+
+    @classmethod
+    def open_work_date(cls, staff_id):
+        """The work day of the staff's latest open timelog (seeking ix_timelogs_staff_id_clock_in), None without one."""
+        return (db.session.query(cls.work_date)
+                          .filter(cls.staff_id == staff_id, cls.clock_in.isnot(None), cls.clock_out.is_(None), cls.work_date.isnot(None))
+                          .order_by(sqlalchemydesc(cls.clock_in)).limit(1).scalar())
+
+
+    @classmethod
+    def upsert_statement(cls, staff_id, kwargs):
+        """INSERT .. ON CONFLICT (staff_id, work_date) DO UPDATE of one clock in/out, returning (id, clock_in, clock_out).
+
+        The first clock_in of the day is kept and the other given columns are
+        only overwritten with non null values, so concurrent or repeated
+        submits of the same staff converge on one timelog per work day.
+        """
+        values = {column: value for column, value in kwargs.items() if column in cls.CLOCK_FIELDS}
+        work_date = cls.get_work_date(values.get("clock_in")) or cls.open_work_date(staff_id) or date.today()
+        values.update(staff_id = staff_id, work_date = work_date, updated_at = datetime.utcnow())
+
+        table = cls.__table__
+        statement = ModelUtil.upsert_insert(db.session, table).values(**values)
+        update = {column: db.func.coalesce(table.c[column], statement.excluded[column]) if column == "clock_in" else db.func.coalesce(statement.excluded[column], table.c[column])
+                  for column in values if column in cls.CLOCK_FIELDS}
+        update["updated_at"] = statement.excluded.updated_at
+        return statement.on_conflict_do_update(index_elements = ["staff_id", "work_date"], set_ = update).returning(table.c.id, table.c.clock_in, table.c.clock_out)
+
+
+    @classmethod
+    def clock_batch(cls, items):
+        """Upserts the clock in/out of each (staff_id, kwargs) item and commits them in one transaction, returns (timelog id, open) per item.
+
+        Items whose idempotency_key was already used by the staff (in an earlier
+        transaction or earlier in the batch) get the stored result and are not
+        applied again; the file row of their picture, uploaded by a concurrent
+        retry that raced the first request, is deleted.
+        """
+        try:
+            logger.info(f"Attempting to clock {len(items)} timelogs in TimeScale")
+            replays = ClockRequestModel.lookup({(staff_id, kwargs["idempotency_key"]) for staff_id, kwargs in items if kwargs.get("idempotency_key")})
+            results = []
+            clock_ins = []
+            requests = []
+            discarded = []
+            for staff_id, kwargs in items:
+                key = (staff_id, kwargs.get("idempotency_key"))
+                if key in replays:
+                    if kwargs.get("picture"):
+                        discarded.append(kwargs["picture"])
+                    results.append(replays[key])
+                    continue
+
+                timelog_id, clock_in, clock_out = db.session.execute(cls.upsert_statement(staff_id, kwargs)).one()
+                result = (timelog_id, clock_out is None)
+                if key[1]:
+                    replays[key] = result
+                    requests.append({"staff_id": staff_id, "key": key[1], "timelog_id": timelog_id, "open": result[1]})
+                clock_ins.append((staff_id, clock_in))
+                results.append(result)
+
+            ClockRequestModel.record(requests)
+            DailyAttendanceModel.refresh(clock_ins)
+            if discarded:
+                FilesModel.query.filter(FilesModel.id.in_(discarded)).delete(synchronize_session = False)
+            db.session.commit()
+            logger.info(f"Successfully clocked {len(items)} timelogs in TimeScale")
+            return results
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to clock {len(items)} timelogs in TimeScale")
+            raise e
+
+
+    @classmethod
+    def backfill_work_dates(cls, batch_size = 200):
+        """Sets work_date of the timelogs without one from their clock_in, batch_size staff per transaction; returns (filled, skipped).
+
+        When a staff has several such timelogs on one day (possible before the
+        unique constraint) only the latest gets the work_date, the others are
+        skipped and keep NULL.
+        """
+        try:
+            logger.info("Attempting to backfill timelog work dates in TimeScale")
+            table = cls.__table__
+            statement = table.update().where(table.c.id == db.bindparam("timelog_id")).values(work_date = db.bindparam("day"), updated_at = table.c.updated_at)
+            staff_ids = [staff_id for (staff_id,) in db.session.query(cls.staff_id).filter(cls.work_date.is_(None), cls.clock_in.isnot(None)).distinct().order_by(cls.staff_id)]
+            filled = skipped = 0
+            for index in range(0, len(staff_ids), batch_size):
+                batch = staff_ids[index:index + batch_size]
+                taken = set(db.session.query(cls.staff_id, cls.work_date).filter(cls.staff_id.in_(batch), cls.work_date.isnot(None)))
+                latest = {}
+                for timelog_id, staff_id, clock_in in (db.session.query(cls.id, cls.staff_id, cls.clock_in)
+                                                                 .filter(cls.staff_id.in_(batch), cls.work_date.is_(None), cls.clock_in.isnot(None)).order_by(cls.clock_in, cls.id)):
+                    skipped += (staff_id, clock_in.date()) in latest
+                    latest[(staff_id, clock_in.date())] = timelog_id
+
+                rows = [{"timelog_id": timelog_id, "day": day} for (staff_id, day), timelog_id in latest.items() if (staff_id, day) not in taken]
+                skipped += len(latest) - len(rows)
+                if rows:
+                    db.session.execute(statement, rows)
+                db.session.commit()
+                filled += len(rows)
+
+            logger.info(f"Successfully backfilled {filled} timelog work dates in TimeScale")
+            return filled, skipped
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Failed to backfill timelog work dates in TimeScale")
+            raise e
+
+
     @classmethod
     def remove_timelog(cls, **kwargs):
         try:
@@ -543,7 +1072,9 @@ class TimeLogModel(db.Model):
             if staff is None:
                 raise MemberNotFoundError(memberparam = "id", memberparamval=kwargs["id"], membertype="Timelog")
             
+            staff_id, clock_in = staff.staff_id, staff.clock_in
             db.session.delete(staff)
+            DailyAttendanceModel.refresh_days(staff_id, clock_in)
             db.session.commit()
             logger.info(f"Successfully deleted timelog: {kwargs['id']} in TimeScale")
         
@@ -555,6 +1086,173 @@ class TimeLogModel(db.Model):
 
 
 
+class ClockRequestModel(db.Model):
+    """Idempotency keys of clock ins/outs and the result returned for them, so a retried request is answered without writing."""
+
+    __tablename__ = "clock_requests"
+
+    id = db.Column(db.Integer, primary_key=True)
+    staff_id = db.Column(db.Integer, db.ForeignKey('staff.id', ondelete='CASCADE'), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    timelog_id = db.Column(db.Integer, db.ForeignKey('timelogs.id', ondelete='CASCADE'), nullable=False)
+    open = db.Column(db.Boolean, nullable=False)
+    created_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint("staff_id", "key", name="uq_clock_requests_staff_id_key"),
+        db.Index("ix_clock_requests_created_at", "created_at"),
+    )
+
+    MAX_KEY_LENGTH = 64
+
+
+    @classmethod
+    def lookup(cls, keys):
+        """Returns {(staff_id, key): (timelog id, open)} of the given (staff_id, key) pairs already recorded, in one query."""
+        if not keys:
+            return {}
+        rows = (db.session.query(cls.staff_id, cls.key, cls.timelog_id, cls.open)
+                          .filter(cls.staff_id.in_({staff_id for staff_id, _ in keys}), cls.key.in_({key for _, key in keys})))
+        return {(staff_id, key): (timelog_id, is_open) for staff_id, key, timelog_id, is_open in rows if (staff_id, key) in keys}
+
+
+    @classmethod
+    def record(cls, requests):
+        """Inserts the request rows in the caller's transaction, ignoring keys a concurrent transaction recorded first."""
+        if requests:
+            db.session.execute(ModelUtil.upsert_insert(db.session, cls.__table__).on_conflict_do_nothing(index_elements = ["staff_id", "key"]),
+                               [{**request, "created_at": datetime.utcnow()} for request in requests])
+
+
+    @classmethod
+    def prune(cls, older_than = timedelta(days = 7)):
+        """Deletes the keys recorded before now - older_than, returns how many; retries after that are applied again."""
+        try:
+            logger.info("Attempting to prune clock requests in TimeScale")
+            removed = cls.query.filter(cls.created_at < datetime.utcnow() - older_than).delete(synchronize_session = False)
+            db.session.commit()
+            logger.info(f"Successfully pruned {removed} clock requests in TimeScale")
+            return removed
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Failed to prune clock requests in TimeScale")
+            raise e
+
+
+
+
+class DailyAttendanceModel(db.Model):
+
+    __tablename__ = "daily_attendance"
+
+    id = db.Column(db.Integer, primary_key=True)
+    staff_id = db.Column(db.Integer, db.ForeignKey('staff.id', ondelete='CASCADE'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    first_in = db.Column(db.DateTime, nullable=False)
+    last_out = db.Column(db.DateTime, nullable=True)
+    worked_seconds = db.Column(db.Integer, nullable=False, default = 0)
+    timelog_count = db.Column(db.Integer, nullable=False, default = 0)
+    status = db.Column(db.String(10), nullable=False, default = "present")
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow, onupdate = datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint("staff_id", "date", name="uq_daily_attendance_staff_id_date"),
+        db.Index("ix_daily_attendance_date_staff_id", "date", "staff_id"),
+    )
+
+    STATUSES = ("present", "open")
+
+
+    @staticmethod
+    def summarize(timelogs):
+        """Folds the (clock_in, clock_out) pairs of one staff day into the summary columns; status is open while any timelog has no clock out."""
+        clock_outs = [clock_out for _, clock_out in timelogs if clock_out]
+        return {"first_in": min(clock_in for clock_in, _ in timelogs),
+                "last_out": max(clock_outs) if clock_outs else None,
+                "worked_seconds": int(sum(max((clock_out - clock_in).total_seconds(), 0) for clock_in, clock_out in timelogs if clock_out)),
+                "timelog_count": len(timelogs),
+                "status": "open" if len(clock_outs) < len(timelogs) else "present"}
+
+
+    @classmethod
+    def refresh_days(cls, staff_id, *clock_ins):
+        """Recomputes the summaries of the days of the given clock ins from their timelogs, in the caller's transaction (the caller commits)."""
+        cls.refresh([(staff_id, clock_in) for clock_in in clock_ins])
+
+
+    @classmethod
+    def refresh(cls, clock_ins):
+        """Batch form of refresh_days for (staff_id, clock_in) pairs, two queries per distinct day."""
+        days = {}
+        for staff_id, clock_in in clock_ins:
+            if isinstance(clock_in, datetime):
+                days.setdefault(clock_in.date(), set()).add(staff_id)
+
+        for day, staff_ids in days.items():
+            start = datetime.combine(day, datetime.min.time())
+            timelogs = {}
+            for staff_id, clock_in, clock_out in (db.session.query(TimeLogModel.staff_id, TimeLogModel.clock_in, TimeLogModel.clock_out)
+                                                            .filter(TimeLogModel.staff_id.in_(staff_ids), TimeLogModel.clock_in >= start, TimeLogModel.clock_in < start + timedelta(days = 1))):
+                timelogs.setdefault(staff_id, []).append((clock_in, clock_out))
+            summaries = {summary.staff_id: summary for summary in cls.query.filter(cls.date == day, cls.staff_id.in_(staff_ids))}
+
+            for staff_id in staff_ids:
+                summary = summaries.get(staff_id)
+                if staff_id not in timelogs:
+                    if summary is not None:
+                        db.session.delete(summary)
+                    continue
+
+                if summary is None:
+                    summary = cls(staff_id = staff_id, date = day)
+                    db.session.add(summary)
+                for field, value in cls.summarize(timelogs[staff_id]).items():
+                    setattr(summary, field, value)
+                summary.updated_at = datetime.utcnow()
+
+
+    @classmethod
+    def rebuild(cls, date_from = None, date_to = None, batch_size = 200):
+        """Recomputes the summaries (of the date range when given) from the timelogs, batch_size staff per transaction; returns the number of summaries written."""
+        try:
+            logger.info("Attempting to rebuild daily attendance in TimeScale")
+            summaries = cls.query
+            timelogs = db.session.query(TimeLogModel.staff_id, TimeLogModel.clock_in, TimeLogModel.clock_out).filter(TimeLogModel.clock_in.isnot(None))
+            if date_from:
+                summaries = summaries.filter(cls.date >= date_from)
+                timelogs = timelogs.filter(TimeLogModel.clock_in >= datetime.combine(date_from, datetime.min.time()))
+            if date_to:
+                summaries = summaries.filter(cls.date <= date_to)
+                timelogs = timelogs.filter(TimeLogModel.clock_in < datetime.combine(date_to, datetime.min.time()) + timedelta(days = 1))
+
+            staff_ids = [staff_id for (staff_id,) in db.session.query(StaffModel.id).order_by(StaffModel.id)]
+            written = 0
+            for index in range(0, len(staff_ids), batch_size):
+                batch = staff_ids[index:index + batch_size]
+                summaries.filter(cls.staff_id.in_(batch)).delete(synchronize_session = False)
+
+                days = {}
+                for staff_id, clock_in, clock_out in timelogs.filter(TimeLogModel.staff_id.in_(batch)):
+                    days.setdefault((staff_id, clock_in.date()), []).append((clock_in, clock_out))
+                now = datetime.utcnow()
+                rows = [{"staff_id": staff_id, "date": day, "updated_at": now, **cls.summarize(day_timelogs)} for (staff_id, day), day_timelogs in days.items()]
+                if rows:
+                    db.session.execute(cls.__table__.insert(), rows)
+                db.session.commit()
+                written += len(rows)
+
+            logger.info(f"Successfully rebuilt {written} daily attendance in TimeScale")
+            return written
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Failed to rebuild daily attendance in TimeScale")
+            raise e
+
+
+
+
 class FilesModel(db.Model):
 
     __tablename__ = "files"
@@ -566,12 +1264,26 @@ class FilesModel(db.Model):
     file_uri = db.Column(db.String(1055), nullable = False)
     file_type = db.Column(db.String(25), nullable = False)
     expired_at = db.Column(db.DateTime,nullable = False)
-    created_at = db.Column(db.DateTime,nullable = False, default = datetime.utcnow())
+    created_at = db.Column(db.DateTime,nullable = False, default = datetime.utcnow)
+    status = db.Column(db.String(10), nullable = False, default = "uploaded", server_default = "uploaded")
+    thumbnail_name = db.Column(db.String(155), nullable = True)
+
+    REFERENCE_FIELDS = ("file_uri", "file_name", "bucket_name", "file_path", "file_type", "expired_at", "created_at", "status", "thumbnail_name", "id")
+    REFERENCE_RENAMES = {"file_uri": "picture", "file_name": "picture_name", "bucket_name": "picture_bucket_name", "file_path": "picture_file_path", "file_type": "picture_file_type", "expired_at": "picture_expired_at", "created_at": "picture_created_at", "status": "picture_status", "thumbnail_name": "picture_thumbnail_name", "id": "picture_id"}
+
+    image_variants = {
+        "image_format": os.getenv("IMAGE_FORMAT", "WEBP"),
+        "quality": int(os.getenv("IMAGE_QUALITY", 80)),
+        "max_dimension": int(os.getenv("IMAGE_MAX_DIMENSION", 1280)),
+        "thumbnail_size": int(os.getenv("IMAGE_THUMBNAIL_SIZE", 160)),
+    }
+    upload_retries = int(os.getenv("UPLOAD_RETRIES", 3))
+    upload_backoff = float(os.getenv("UPLOAD_RETRY_BACKOFF_SECONDS", 0.5))
+    spool_dir = os.getenv("UPLOAD_SPOOL_DIR") or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "spool")
 
     @staticmethod
-    def add_file(file, bucket, file_path=""):
+    def add_file(file, bucket, file_path="", background = False):
         try:
-            minio.create_bucket(bucket)
             if not (isinstance(file, FileStorage) and bool(file)):
                 return
             
@@ -589,7 +1301,29 @@ class FilesModel(db.Model):
                 return None
             file_type = file_name.rsplit('.', 1)[1].lower()
             file_name =  datetime.strftime(datetime.utcnow(),"%Y%m%d%H%M%S%f") + "." + file_type
-            minio_resp = minio.upload_object(bucket, os.path.join(file_path,file_name), file, -1)
+            content_type = file.content_type or "application/octet-stream"
+
+            if background:
+                filesobj = FilesModel(file_name = file_name, file_path = file_path, file_uri = "", bucket_name = bucket, file_type = file_type, expired_at = datetime.utcnow(), status = "pending")
+                db.session.add(filesobj)
+                db.session.commit()
+                data = None
+                if not FilesModel.spool(filesobj.id, file.stream):
+                    file.seek(0, os.SEEK_SET)
+                    data = file.read()
+                app = current_app._get_current_object()
+                if uploader.submit(FilesModel.upload_pending_file, app, filesobj.id, content_type, data) is None:
+                    if data is None:
+                        logger.warning(f"Upload queue is full, file: {filesobj.id} stays pending until flask retry-uploads")
+                    else:
+                        filesobj.status = "failed"
+                        db.session.commit()
+                        logger.error(f"Upload queue is full and file: {filesobj.id} couldn't be spooled, marked failed")
+                logger.info("Successfully queued files for Minio and added files info in TimeScale")
+                return filesobj.id
+
+            minio.create_bucket(bucket)
+            minio_resp = minio.upload_object(bucket, os.path.join(file_path,file_name), file.stream, filesize, content_type)
             file_uri = minio.get_object_link(bucket,os.path.join(file_path,file_name),"GET")
             expired_at = datetime.utcnow() + timedelta(days = 7)
             filesobj = FilesModel(file_name = file_name, file_path = file_path, file_uri = file_uri, bucket_name = bucket, file_type = file_type, expired_at = expired_at)
@@ -608,8 +1342,128 @@ class FilesModel(db.Model):
             raise e
 
 
+    @staticmethod
+    def upload_pending_file(app, file_id, content_type, data = None):
+        """Uploads the data (its spooled copy by default) of a pending file to Minio and marks the file row uploaded.
+
+        Minio errors are retried upload_retries times with exponential backoff
+        from upload_backoff seconds; after that the row is marked failed and
+        its spooled data kept for retry_uploads.
+        """
+        with app.app_context():
+            filesobj = db.session.get(FilesModel, file_id)
+            if filesobj is None:
+                logger.warning(f"Pending file: {file_id} was discarded before its upload, skipping")
+                FilesModel.unspool(file_id)
+                return
+
+            if data is None:
+                try:
+                    with open(FilesModel.spool_path(file_id), "rb") as spooled:
+                        data = spooled.read()
+                except FileNotFoundError:
+                    filesobj.status = "failed"
+                    db.session.commit()
+                    logger.error(f"Pending file: {file_id} has no spooled data, marked failed")
+                    return
+
+            for attempt in range(FilesModel.upload_retries + 1):
+                try:
+                    logger.info(f"Attempting to upload pending file: {file_id} in Minio")
+                    minio.create_bucket(filesobj.bucket_name)
+                    object_name = os.path.join(filesobj.file_path or "", filesobj.file_name)
+                    payload, payload_type = data, content_type
+
+                    variants = ImageUtil.build_variants(data, **FilesModel.image_variants) if content_type.startswith("image/") else None
+                    if variants:
+                        payload, thumbnail, file_type = variants
+                        stem = filesobj.file_name.rsplit(".", 1)[0]
+                        payload_type = "image/jpeg" if file_type == "jpg" else f"image/{file_type}"
+                        filesobj.file_name = f"{stem}.{file_type}"
+                        filesobj.file_type = file_type
+                        filesobj.thumbnail_name = f"{stem}_thumbnail.{file_type}"
+                        object_name = os.path.join(filesobj.file_path or "", filesobj.file_name)
+                        minio.upload_object(filesobj.bucket_name, os.path.join(filesobj.file_path or "", filesobj.thumbnail_name), BytesIO(thumbnail), len(thumbnail), payload_type)
+
+                    minio.upload_object(filesobj.bucket_name, object_name, BytesIO(payload), len(payload), payload_type)
+                    FilesModel.refresh_link(filesobj, datetime.utcnow())
+                    filesobj.status = "uploaded"
+                    db.session.commit()
+                    FilesModel.unspool(file_id)
+                    logger.info(f"Successfully uploaded pending file: {file_id} in Minio")
+                    return
+
+                except Exception as e:
+                    db.session.rollback()
+                    if attempt < FilesModel.upload_retries:
+                        delay = FilesModel.upload_backoff * 2 ** attempt
+                        logger.warning(f"Failed to upload pending file: {file_id} in Minio ({e}), retrying in {delay}s")
+                        sleep(delay)
+                        continue
+                    filesobj.status = "failed"
+                    db.session.commit()
+                    logger.error(f"Failed to upload pending file: {file_id} in Minio after {attempt + 1} attempts")
+                    raise e
+
+
+    @staticmethod
+    def spool_path(file_id):
+        return os.path.join(FilesModel.spool_dir, str(file_id))
+
+
+    @staticmethod
+    def spool(file_id, stream):
+        """Copies the stream of a pending file to disk, where it stays until it is uploaded so retry_uploads can upload it after a failure or a restart; returns whether it did."""
+        try:
+            os.makedirs(FilesModel.spool_dir, exist_ok = True)
+            with open(FilesModel.spool_path(file_id), "wb") as spooled:
+                shutil.copyfileobj(stream, spooled)
+            return True
+        except OSError as e:
+            logger.warning(f"Unable to spool pending file: {file_id} ({e}), it can't be retried if its upload fails")
+            FilesModel.unspool(file_id)
+            return False
+
+
+    @staticmethod
+    def unspool(file_id):
+        try:
+            os.remove(FilesModel.spool_path(file_id))
+        except FileNotFoundError:
+            pass
+
+
+    @staticmethod
+    def retry_uploads(pending_after = timedelta(minutes = 5)):
+        """Uploads the failed files and the ones pending for longer than pending_after (left by a worker that exited) from their spooled data.
+
+        Returns (uploaded, failed, missing) file ids; missing rows have no
+        spooled data left and are marked failed.
+        """
+        logger.info("Attempting to retry file uploads in TimeScale")
+        app = current_app._get_current_object()
+        files = (db.session.query(FilesModel.id, FilesModel.file_name)
+                           .filter(sqlalchemyor(FilesModel.status == "failed", sqlalchemyand(FilesModel.status == "pending", FilesModel.created_at < datetime.utcnow() - pending_after)))
+                           .order_by(FilesModel.id).all())
+        db.session.commit()
+
+        uploaded, failed, missing = [], [], []
+        for file_id, file_name in files:
+            if not os.path.exists(FilesModel.spool_path(file_id)):
+                FilesModel.query.filter_by(id = file_id).update({"status": "failed"})
+                db.session.commit()
+                missing.append(file_id)
+                continue
+            try:
+                FilesModel.upload_pending_file(app, file_id, mimetypes.guess_type(file_name)[0] or "application/octet-stream")
+                uploaded.append(file_id)
+            except Exception:
+                failed.append(file_id)
+
+        logger.info(f"Successfully retried file uploads in TimeScale: {len(uploaded)} uploaded, {len(failed)} failed, {len(missing)} without data")
+        return uploaded, failed, missing
+
 
-            
     @staticmethod
     def update_file(operation = 'refresh', **kwargs):
         try:
@@ -618,7 +1472,7 @@ class FilesModel(db.Model):
             BaseUtil.perform_value_check(operation, ['add','remove','refresh'], 'operation')
             BaseUtil.perform_argument_check(kwargs, requiredargs=["id"], callback_name="FilesModel.update_image")
             
-            files = FilesModel.query.filter_by(userid = kwargs["id"]).all()
+            files = FilesModel.query.filter_by(id = kwargs["id"]).all()
             current_time = datetime.utcnow()
             check_time =  current_time + timedelta(days = 1)
 
@@ -634,8 +1488,7 @@ class FilesModel(db.Model):
 
             for file in files:
                 if check_time > file.expired_at:
-                    file.file_uri = minio.get_object_link(os.getenv("MINIO_IMAGES_BUCKET"),file.file_name)
-                    file.expired_at = current_time + timedelta(days=7)
+                    FilesModel.refresh_link(file, current_time)
 
             db.session.commit()
 
@@ -645,8 +1498,61 @@ class FilesModel(db.Model):
             db.session.rollback()
             logger.error(f"Failed to update(mode = {operation}) user images in TimeScale")
             raise e
+
+
+    @staticmethod
+    def refresh_link(file, current_time):
+        file.file_uri = minio.get_object_link(file.bucket_name, os.path.join(file.file_path or "", file.file_name), "GET")
+        file.expired_at = current_time + timedelta(days=7)
+
+
+    @staticmethod
+    def refresh_expiring_files(within = timedelta(days = 1), batch_size = 500):
+        """Re-signs the stored links expiring within the given window, batch by batch in id order; returns the refreshed count."""
+        try:
+            logger.info("Attempting to refresh expiring files in TimeScale")
+            current_time = datetime.utcnow()
+            check_time = current_time + within
+            last_id = 0
+            refreshed = 0
+
+            while True:
+                files = (FilesModel.query.filter(FilesModel.expired_at < check_time, FilesModel.status == "uploaded", FilesModel.id > last_id)
+                                          .order_by(FilesModel.id).limit(batch_size).all())
+                if not files:
+                    break
+
+                for file in files:
+                    FilesModel.refresh_link(file, current_time)
+                last_id = files[-1].id
+                db.session.commit()
+                db.session.expunge_all()
+
+                refreshed += len(files)
+                logger.info(f"Refreshed files(quantity: {refreshed}) in TimeScale")
+
+            logger.info(f"Successfully refreshed files(quantity: {refreshed}) in TimeScale")
+            return refreshed
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Failed to refresh expiring files in TimeScale")
+            raise e
+
+
+    @staticmethod
+    def sign_links(rows, alias = "picture"):
+        """Replaces the stored link of the joined file on each row with a fresh one from the link cache."""
+        for row in rows:
+            if row.get(f"{alias}_status", "uploaded") != "uploaded":
+                row[alias] = None
+            elif row.get(f"{alias}_bucket_name") and row.get(f"{alias}_name"):
+                row[alias] = minio.get_cached_object_link(row[f"{alias}_bucket_name"], os.path.join(row.get(f"{alias}_file_path") or "", row[f"{alias}_name"]))
+                if row.get(f"{alias}_thumbnail_name"):
+                    row[f"{alias}_thumbnail"] = minio.get_cached_object_link(row[f"{alias}_bucket_name"], os.path.join(row.get(f"{alias}_file_path") or "", row[f"{alias}_thumbnail_name"]))
+        return rows
+
         
-    
     @staticmethod
     def remove_file(id, deletedimagenames):
         try:
@@ -662,7 +1568,9 @@ class FilesModel(db.Model):
 
             for image in files:
                 db.session.delete(image)
-                minio.delete_file(os.getenv("MINIO_IMAGES_BUCKET"), files.file_name)
+                minio.delete_file(image.bucket_name, os.path.join(image.file_path or "", image.file_name))
+                if image.thumbnail_name:
+                    minio.delete_file(image.bucket_name, os.path.join(image.file_path or "", image.thumbnail_name))
 
             logger.info("Successfully removed the files from Minio")
 
@@ -674,3 +1582,32 @@ class FilesModel(db.Model):
             db.session.rollback()
             logger.error("Failed to remove files from Minio/TimeScale")
             raise e
+
+
+    @staticmethod
+    def name_timestamp(file_name):
+        """The utc upload time encoded in the stored file name by add_file, None for names not generated by it."""
+        try:
+            return datetime.strptime(file_name.split(".", 1)[0][:20], "%Y%m%d%H%M%S%f")
+        except (AttributeError, ValueError):
+            return None
+
+
+
+
+def spread_by_id(row_id, frozen):
+    """A frozen timestamp plus id microseconds: for the tables without a per row time to derive it from, keeps the value but orders the rows sharing it by insertion."""
+    return frozen + timedelta(microseconds = row_id)
+
+
+
+
+# (model, column, source fields, derive) of the timestamps written with a default evaluated once at import, see ModelUtil.backfill_frozen_column
+timestamp_backfills = (
+    (TimeLogModel, "updated_at", ("clock_in", "clock_out"), lambda clock_in, clock_out: clock_out or clock_in),
+    (StaffModel, "updated_at", ("registration_date",), lambda registration_date: registration_date),
+    (FilesModel, "created_at", ("file_name",), FilesModel.name_timestamp),
+    (ScheduleModel, "updated_at", ("id", "updated_at"), spread_by_id),
+    (WeekOffModel, "updated_at", ("id", "updated_at"), spread_by_id),
+    (OffDayModel, "updated_at", ("id", "updated_at"), spread_by_id),
+)
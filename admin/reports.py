@@ -0,0 +1,163 @@
+import os
+import numpy as np
+from datetime import date
+from sqlalchemy import select, extract
+from admin.models import db, StaffModel, ScheduleModel, WeekOffModel, OffDayModel, DailyAttendanceModel
+from utils.utilities import BaseUtil, ModelUtil, Logger
+from utils.consts import DayEnum
+from utils.errors import InvalidValueError
+
+
+
+logger = Logger.getLogger(sub_name="admin: Reports")
+DAY = 86400
+
+
+
+class AttendanceReport:
+    """Worked hours, late arrivals, early leaves and absences per staff per day, week or month.
+
+    The daily_attendance summaries (see DailyAttendanceModel) are read in raw
+    DBAPI batches as epoch seconds into NumPy arrays and scattered into
+    (staff x day) matrices, which are then summed into periods with reduceat;
+    nothing loops over the rows in Python. A staff member without a schedule
+    has no expected days, so only worked hours are reported for them, and no
+    day before a staff member's registration date is expected. Half day offs
+    are expected working days, like in ShiftCalendar.
+    """
+
+    PERIODS = ("day", "week", "month")
+    FIELDS = ("staff_id", "name", "period", "worked_hours", "days_present", "late_arrivals", "early_leaves", "absences")
+    WEEKDAYS = tuple(day.value for day in DayEnum)
+
+    def __init__(self, date_from: date, date_to: date, period = "month", staff_ids = None, grace_minutes = None, batch_size = 10000):
+        BaseUtil.perform_value_check(period, self.PERIODS, "period")
+        if date_to < date_from:
+            raise InvalidValueError(paramname = "date_to", value = date_to, expectedvalue = [f"on or after {date_from}"])
+        self.date_from = date_from
+        self.date_to = date_to
+        self.period = period
+        self.staff_ids = sorted(set(staff_ids)) if staff_ids else None
+        self.grace = 60 * (grace_minutes if grace_minutes is not None else int(os.getenv("ATTENDANCE_GRACE_MINUTES", 10)))
+        self.batch_size = batch_size
+        self.first_day = (date_from - date(1970, 1, 1)).days
+        self.days = (date_to - date_from).days + 1
+
+
+    def load_staff(self):
+        """Returns the sorted staff ids, their names, shift start/end seconds (nan without a schedule), a (staff x weekday) week off mask and the registration day numbers."""
+        query = (db.session.query(StaffModel.id, StaffModel.name, ScheduleModel.shift_start, ScheduleModel.shift_ends, StaffModel.schedule_id, StaffModel.registration_date)
+                           .outerjoin(ScheduleModel, StaffModel.schedule_id == ScheduleModel.id).order_by(StaffModel.id))
+        if self.staff_ids:
+            query = query.filter(StaffModel.id.in_(self.staff_ids))
+        staff = query.all()
+
+        seconds = lambda shift: shift.hour * 3600 + shift.minute * 60 + shift.second if shift else np.nan
+        ids = np.fromiter((row[0] for row in staff), dtype = np.int64, count = len(staff))
+        shift_start = np.fromiter((seconds(row[2]) for row in staff), dtype = np.float64, count = len(staff))
+        shift_ends = np.fromiter((seconds(row[3]) for row in staff), dtype = np.float64, count = len(staff))
+        schedule_ids = np.fromiter((row[4] or 0 for row in staff), dtype = np.int64, count = len(staff))
+        registered = np.fromiter(((row[5].date() - date(1970, 1, 1)).days if row[5] else self.first_day for row in staff), dtype = np.int64, count = len(staff))
+
+        weekoffs = {}
+        for schedule_id, name in db.session.query(WeekOffModel.schedule_id, WeekOffModel.name):
+            if name in self.WEEKDAYS:
+                weekoffs.setdefault(schedule_id, np.zeros(7, dtype = bool))[self.WEEKDAYS.index(name)] = True
+        schedule_weekoffs = np.zeros((schedule_ids.max(initial = 0) + 1, 7), dtype = bool)
+        for schedule_id, mask in weekoffs.items():
+            if schedule_id < len(schedule_weekoffs):
+                schedule_weekoffs[schedule_id] = mask
+        return ids, [row[1] for row in staff], shift_start, shift_ends, schedule_weekoffs[schedule_ids], registered
+
+
+    def load_attendance(self):
+        """Returns (staff_id, first_in, last_out, worked_seconds) arrays of the daily_attendance rows, times as epoch seconds and last_out nan when open."""
+        statement = (select(DailyAttendanceModel.staff_id, extract("epoch", DailyAttendanceModel.first_in), extract("epoch", DailyAttendanceModel.last_out), DailyAttendanceModel.worked_seconds)
+                           .where(DailyAttendanceModel.date >= self.date_from, DailyAttendanceModel.date <= self.date_to))
+        if self.staff_ids:
+            statement = statement.where(DailyAttendanceModel.staff_id.in_(self.staff_ids))
+
+        batches = [np.array(batch, dtype = np.float64).reshape(-1, 4) for batch in ModelUtil.iter_raw_batches(db.session, statement, self.batch_size)]
+        attendance = np.concatenate(batches) if batches else np.empty((0, 4))
+        return attendance[:, 0].astype(np.int64), attendance[:, 1], attendance[:, 2], attendance[:, 3]
+
+
+    def load_offdays(self):
+        """Returns (staff_id, day number) arrays of the full day offs; half day offs stay expected working days."""
+        query = (db.session.query(OffDayModel.staff_id, OffDayModel.date)
+                           .filter(OffDayModel.date >= self.date_from, OffDayModel.date <= self.date_to, OffDayModel.is_half_day.is_(False)))
+        if self.staff_ids:
+            query = query.filter(OffDayModel.staff_id.in_(self.staff_ids))
+        offdays = query.all()
+        return (np.fromiter((row[0] for row in offdays), dtype = np.int64, count = len(offdays)),
+                np.fromiter(((row[1] - date(1970, 1, 1)).days for row in offdays), dtype = np.int64, count = len(offdays)))
+
+
+    def period_starts(self):
+        """Returns the column index where each period starts and the first day of each period."""
+        days = np.arange(self.first_day, self.first_day + self.days).astype("datetime64[D]")
+        if self.period == "day":
+            keys = days
+        elif self.period == "week":
+            keys = days - ((days.astype(np.int64) + 3) % 7).astype("timedelta64[D]")
+        else:
+            keys = days.astype("datetime64[M]").astype("datetime64[D]")
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        return starts, np.maximum(keys[starts], days[0]).astype(date)
+
+
+    def aggregate(self, staff_ids, shift_start, shift_ends, weekoffs, registered, attendance_staff, first_in, last_out, worked_seconds, offday_staff, offday_day, today = None):
+        """Folds the daily attendance into (staff x period) matrices of worked hours, days present, late arrivals, early leaves and absences."""
+        staff_count, days = len(staff_ids), self.days
+        cells = staff_count * days
+
+        rows = np.searchsorted(staff_ids, attendance_staff)
+        known = (rows < staff_count) & (staff_ids[np.minimum(rows, staff_count - 1)] == attendance_staff) if staff_count else np.zeros(len(rows), dtype = bool)
+        columns = np.floor_divide(first_in, DAY).astype(np.int64) - self.first_day
+        known &= (columns >= 0) & (columns < days)
+        keys = rows[known] * days + columns[known]
+
+        worked = np.bincount(keys, weights = worked_seconds[known], minlength = cells).reshape(staff_count, days)
+        present = np.bincount(keys, minlength = cells).reshape(staff_count, days) > 0
+        first_ins = np.full(cells, np.inf)
+        first_ins[keys] = first_in[known]
+        last_outs = np.full(cells, -np.inf)
+        last_outs[keys] = np.nan_to_num(last_out[known], nan = -np.inf)
+        first_in, last_out = first_ins.reshape(staff_count, days), last_outs.reshape(staff_count, days)
+
+        offday_rows = np.searchsorted(staff_ids, offday_staff)
+        offday_known = (offday_rows < staff_count) & (staff_ids[np.minimum(offday_rows, max(staff_count - 1, 0))] == offday_staff) if staff_count else np.zeros(len(offday_rows), dtype = bool)
+        offday = np.zeros((staff_count, days), dtype = bool)
+        offday[offday_rows[offday_known], offday_day[offday_known] - self.first_day] = True
+
+        day_numbers = np.arange(self.first_day, self.first_day + days)
+        day_starts = (day_numbers * DAY)[None, :]
+        scheduled = ~np.isnan(shift_start)[:, None]
+        shift_start, shift_ends = np.nan_to_num(shift_start)[:, None], np.nan_to_num(shift_ends)[:, None]
+        shift_ends = shift_ends + np.where(shift_ends <= shift_start, DAY, 0)
+
+        expected = scheduled & ~weekoffs[:, (day_numbers + 3) % 7] & ~offday & (day_numbers[None, :] >= registered[:, None])
+        late = present & expected & (first_in > day_starts + shift_start + self.grace)
+        early = present & expected & np.isfinite(last_out) & (last_out < day_starts + shift_ends - self.grace)
+        elapsed = (day_numbers < ((today or date.today()) - date(1970, 1, 1)).days)[None, :]
+        absent = expected & ~present & elapsed
+
+        starts, periods = self.period_starts()
+        sums = lambda matrix: np.add.reduceat(matrix.astype(np.float64), starts, axis = 1) if staff_count else np.zeros((0, len(starts)))
+        return periods, {"worked_hours": sums(worked) / 3600, "days_present": sums(present), "late_arrivals": sums(late), "early_leaves": sums(early), "absences": sums(absent)}
+
+
+    @ModelUtil.on_replica(db)
+    def rows(self):
+        """Yields one dict per staff per period."""
+        logger.info("Attempting to aggregate attendance in TimeScale")
+        staff_ids, names, shift_start, shift_ends, weekoffs, registered = self.load_staff()
+        periods, totals = self.aggregate(staff_ids, shift_start, shift_ends, weekoffs, registered, *self.load_attendance(), *self.load_offdays())
+        logger.info(f"Successfully aggregated attendance of {len(staff_ids)} staff in TimeScale")
+
+        worked_hours = np.round(totals["worked_hours"], 2)
+        counts = {field: totals[field].astype(np.int64) for field in ("days_present", "late_arrivals", "early_leaves", "absences")}
+        for row, (staff_id, name) in enumerate(zip(staff_ids.tolist(), names)):
+            for column, period in enumerate(periods):
+                yield {"staff_id": staff_id, "name": name, "period": period, "worked_hours": float(worked_hours[row, column]),
+                       **{field: int(values[row, column]) for field, values in counts.items()}}
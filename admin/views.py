@@ -1,10 +1,16 @@
-from flask import render_template, redirect, flash, url_for, request, session
+from flask import render_template, redirect, flash, url_for, request, session, jsonify, Response, stream_with_context
 from flask.views import MethodView
+from datetime import date
+from itertools import islice
 from flask_login import login_required, logout_user, login_user, current_user
-from utils.errors import FormDataViolationError
+from utils.errors import FormDataViolationError, InvalidValueError
 from utils.utilities import FlaskUtil
-from admin.forms import SigninForm, StaffForm, ScheduleForm, TimeLogForm
-from admin.models import AdminModel, StaffModel, TimeLogModel, ScheduleModel
+from io import TextIOWrapper
+from admin.forms import SigninForm, StaffForm, ScheduleForm, TimeLogForm, StaffImportForm
+from admin.exporter import TimeLogExporter
+from admin.importer import StaffImporter
+from admin.reports import AttendanceReport
+from admin.models import AdminModel, StaffModel, TimeLogModel, ScheduleModel, uploader, timelog_writer, minio, principal_cache, schedule_cache, shift_calendar
 
 
 
@@ -29,6 +35,21 @@ class AdminIndexView(MethodView):
     
 
 
+class MetricsView(MethodView):
+
+    @FlaskUtil.manager_required(redirecturl="admin.signin")
+    def get(self):
+        return jsonify({
+            "uploads": uploader.stats(),
+            "timelog_writes": timelog_writer.stats(),
+            "file_links": minio.link_cache.stats(),
+            "principals": principal_cache.stats(),
+            "schedules": schedule_cache.stats(),
+            "calendar": shift_calendar.stats(),
+        })
+
+
+
 class AdminSignin(MethodView):
     
     def get(self):
@@ -95,8 +116,7 @@ class AddStaff(MethodView):
     @FlaskUtil.manager_required(redirecturl="staff.signin")
     def get(self):
         self.form.reset_defaults()
-        schedules = ScheduleModel.list_schedule()
-        schedules = list(map(lambda x: (x['id'], f"{x['name']} ({x['shift_start']} - {x['shift_ends']})"), schedules))
+        schedules = ScheduleModel.list_schedule_choices()
         self.form.update_default(default_schedule = schedules, repeat_default_schedule = False, allow_empty_schedule_choice = True)
         return render_template("admin/addstaff.html", form = self.form)
 
@@ -128,6 +148,37 @@ class AddStaff(MethodView):
 
 
 
+class ImportStaff(MethodView):
+
+    def __init__(self):
+        super().__init__()
+        self.form = StaffImportForm()
+
+
+    @FlaskUtil.manager_required(redirecturl="staff.signin")
+    def get(self):
+        return render_template("admin/importstaff.html", form = self.form, columns = StaffImporter.COLUMNS)
+
+
+    @FlaskUtil.manager_required(redirecturl="staff.signin")
+    def post(self):
+        if not (self.form.validate_on_submit() and self.form.validate_after_submit()):
+            flash(message="Failed to Import Staff Members", category="warning")
+            return render_template("admin/importstaff.html", form = self.form, columns = StaffImporter.COLUMNS)
+
+        try:
+            importer = StaffImporter(allow_managers = getattr(current_user, "is_admin", False))
+            imported, errors = importer.run(TextIOWrapper(self.form.file.data.stream, encoding = "utf-8-sig", newline = ""))
+        except Exception as e:
+            flash(message="Failed to Import Staff Members", category=getattr(e, "category", "error"))
+            return render_template("admin/importstaff.html", form = self.form, columns = StaffImporter.COLUMNS)
+
+        flash(message=f"Imported {imported} Staff Members, {len(errors)} rows failed", category="success" if not errors else "warning")
+        return render_template("admin/importstaff.html", form = self.form, columns = StaffImporter.COLUMNS, imported = imported, errors = errors[:StaffImporter.MAX_REPORTED_ERRORS], failed = len(errors))
+
+
+
+
 class AddSchedule(MethodView):
 
     def __init__(self):
@@ -166,8 +217,13 @@ class ViewStaff(MethodView):
 
     @FlaskUtil.manager_required(redirecturl="staff.signin")
     def get(self):
-        staff = StaffModel.list_staff(get_references = True)
-        return render_template("admin/viewstaff.html", staff = staff)
+        pagination = FlaskUtil.get_pagination_args(request.args, sortable = StaffModel.SORTABLE_FIELDS)
+        try:
+            staff, next_cursor = StaffModel.list_staff(get_references = True, **pagination)
+        except InvalidValueError:
+            flash("Invalid page requested, showing the first page", category="warning")
+            return redirect(url_for("admin.viewstaff", page_size = pagination["page_size"]))
+        return render_template("admin/viewstaff.html", staff = staff, pagination = pagination, next_cursor = next_cursor, sortable = StaffModel.SORTABLE_FIELDS)
 
 
     @FlaskUtil.manager_required(redirecturl="staff.signin")
@@ -210,8 +266,7 @@ class ViewStaff(MethodView):
             flash("Staff member doesn't exists", category="warning")
             return redirect(url_for("admin.viewstaff"))
         form = StaffForm()
-        schedules = ScheduleModel.list_schedule()
-        schedules = list(map(lambda x: (x['id'], f"{x['name']} ({x['shift_start']} - {x['shift_ends']})"), schedules))
+        schedules = ScheduleModel.list_schedule_choices()
         form.update_default(default_schedule = schedules, repeat_default_schedule = False, allow_empty_schedule_choice = True)
         form.frefill_form_for_update(staff)
         return render_template("admin/editstaff.html", form = form)
@@ -223,11 +278,18 @@ class ViewSchedule(MethodView):
 
     @login_required
     def get(self, id = None):
+        pagination = FlaskUtil.get_pagination_args(request.args, sortable = ScheduleModel.SORTABLE_FIELDS)
+        next_cursor = None
         if id:
+            pagination = None
             schedules = ScheduleModel.fetch_schedule(get_references = True, id = id)
         else:
-            schedules = ScheduleModel.list_schedule(get_references = True)
-        return render_template("admin/viewschedule.html", schedules = schedules)
+            try:
+                schedules, next_cursor = ScheduleModel.list_schedule(get_references = True, **pagination)
+            except InvalidValueError:
+                flash("Invalid page requested, showing the first page", category="warning")
+                return redirect(url_for("admin.viewschedule", page_size = pagination["page_size"]))
+        return render_template("admin/viewschedule.html", schedules = schedules, pagination = pagination, next_cursor = next_cursor, sortable = ScheduleModel.SORTABLE_FIELDS)
 
 
     @FlaskUtil.manager_required(redirecturl="staff.signin")
@@ -280,8 +342,14 @@ class ViewTimeLogs(MethodView):
 
     @FlaskUtil.manager_required(redirecturl="staff.staffindex")
     def get(self, id):
-        timelogs = TimeLogModel.fetch_timelog(get_references = True, staff_id = id)
-        return render_template("admin/viewtimelog.html", timelogs = timelogs, staff_id = id)
+        pagination = FlaskUtil.get_pagination_args(request.args, sortable = TimeLogModel.SORTABLE_FIELDS, default_sort_by = "clock_in", default_sort_order = "desc")
+        filters = {"date_from": request.args.get("date_from", type = date.fromisoformat), "date_to": request.args.get("date_to", type = date.fromisoformat)}
+        try:
+            timelogs, next_cursor = TimeLogModel.fetch_timelog(get_references = True, staff_id = id, **filters, **pagination)
+        except InvalidValueError:
+            flash("Invalid page requested, showing the first page", category="warning")
+            return redirect(url_for("admin.viewtimelogs", id = id, page_size = pagination["page_size"]))
+        return render_template("admin/viewtimelog.html", timelogs = timelogs, staff_id = id, pagination = pagination, next_cursor = next_cursor, sortable = TimeLogModel.SORTABLE_FIELDS, filters = filters)
 
 
     @FlaskUtil.admin_required(redirecturl="staff.signin")
@@ -321,3 +389,41 @@ class ViewTimeLogs(MethodView):
         form.frefill_form_for_update(timelog)
         return render_template("admin/edittimelog.html", form = form, staff_id = id)
 
+
+
+
+class ExportTimeLogs(MethodView):
+
+    @FlaskUtil.manager_required(redirecturl="staff.staffindex")
+    def get(self):
+        try:
+            exporter = TimeLogExporter(export_format = request.args.get("format", "csv"),
+                                       date_from = request.args.get("date_from", type = date.fromisoformat),
+                                       date_to = request.args.get("date_to", type = date.fromisoformat),
+                                       staff_ids = request.args.getlist("staff_id", type = int))
+        except InvalidValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return Response(stream_with_context(exporter.stream()), mimetype = exporter.mimetype,
+                        headers = {"Content-Disposition": f"attachment; filename={exporter.filename}"})
+
+
+
+
+class AttendanceReportView(MethodView):
+
+    max_rows = 2000
+
+    @FlaskUtil.manager_required(redirecturl="staff.staffindex")
+    def get(self):
+        today = date.today()
+        filters = {"date_from": request.args.get("date_from", type = date.fromisoformat) or today.replace(day = 1),
+                   "date_to": request.args.get("date_to", type = date.fromisoformat) or today,
+                   "period": request.args.get("period", "month"),
+                   "staff_id": request.args.get("staff_id", type = int)}
+        try:
+            report = AttendanceReport(filters["date_from"], filters["date_to"], period = filters["period"], staff_ids = [filters["staff_id"]] if filters["staff_id"] else None)
+            rows = list(islice(report.rows(), self.max_rows + 1))
+        except InvalidValueError as e:
+            flash(str(e), category="warning")
+            return redirect(url_for("admin.attendancereport"))
+        return render_template("admin/attendancereport.html", rows = rows[:self.max_rows], truncated = len(rows) > self.max_rows, filters = filters, periods = AttendanceReport.PERIODS)
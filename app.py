@@ -1,14 +1,20 @@
 import os
+import csv
 import click
-from flask import Flask, session
+from datetime import timedelta
+from flask import Flask, session, request, jsonify
 from flask_login import LoginManager
-from flask_wtf.csrf import CSRFProtect
+from flask_wtf.csrf import CSRFProtect, CSRFError
 from admin.controller import admin
 from staff.controller import staff
-from admin.models import db, migrate
-from admin.models import AdminModel, StaffModel
+from admin.models import db, migrate, timestamp_backfills
+from admin.models import FilesModel, Principal, DailyAttendanceModel, TimeLogModel, ClockRequestModel
 from admin.views import IndexView
 from admin.admin import SuperUser
+from admin.exporter import TimeLogExporter
+from admin.importer import StaffImporter
+from admin.reports import AttendanceReport
+from utils.utilities import ModelUtil, DatabaseEngine, ServerSideSessionInterface, Logger
 
 
 
@@ -16,12 +22,20 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 loginmanager = LoginManager()
 csrf = CSRFProtect()
 app = Flask(__name__)
-app.config["SECRET_KEY"] = os.urandom(30).hex()
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'db.sqlite3')
+app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
+if not app.config["SECRET_KEY"]:
+    Logger.getLogger(sub_name="app").warning("SECRET_KEY is not set, using a random key: sessions and csrf tokens won't survive restarts or work across workers")
+    app.config["SECRET_KEY"] = os.urandom(30).hex()
+session_interface = ServerSideSessionInterface.from_env(default_sqlite_path = os.path.join(basedir, 'sessions.sqlite3'))
+if session_interface is not None:
+    app.session_interface = session_interface
+database = DatabaseEngine(default_uri = 'sqlite:///' + os.path.join(basedir, 'db.sqlite3'))
+database.configure(app)
 
 
 
 db.init_app(app)
+database.init_app(app, db)
 migrate.init_app(app)
 loginmanager.init_app(app)
 csrf.init_app(app)
@@ -32,16 +46,18 @@ app.add_url_rule("/", view_func = IndexView.as_view("index"))
 app.register_blueprint(blueprint=admin, url_prefix='/admin')
 app.register_blueprint(blueprint=staff, url_prefix='/employee')
 
+@app.errorhandler(CSRFError)
+def csrf_error(e):
+    if request.endpoint == "staff.timelogapi":
+        return jsonify({"error": e.description}), 400
+    return e
+
+
 @loginmanager.user_loader
 def load_user(user_id):
-    if session.get("_user_type_model") == "admin":
-        admin = db.session.get(AdminModel, int(user_id))
-        admin.is_admin = True
-        return admin
-    elif session.get("_user_type_model") == "staff":
-        staff = db.session.get(StaffModel, int(user_id))
-        staff.is_admin = False
-        return staff
+    user_type = session.get("_user_type_model")
+    if user_type in ("admin", "staff"):
+        return Principal.load(user_type, int(user_id))
     else:
         return
 
@@ -58,5 +74,118 @@ def superuser(name, email, password):
         click.echo(f'Error: {e}')
 
 
+@app.cli.command('refresh-files')
+@click.option('--within-hours', default=24, show_default=True, help='Refresh the links expiring within these many hours.')
+@click.option('--batch-size', default=500, show_default=True, help='Number of files refreshed per transaction.')
+def refresh_files(within_hours, batch_size):
+    try:
+        refreshed = FilesModel.refresh_expiring_files(within = timedelta(hours = within_hours), batch_size = batch_size)
+        click.echo(f'Refreshed {refreshed} file links successfully!')
+    except Exception as e:
+        click.echo(f'Error: {e}')
+
+
+@app.cli.command('retry-uploads')
+@click.option('--pending-minutes', default=5, show_default=True, help='Retry the files pending for longer than these many minutes (plus every failed one).')
+def retry_uploads(pending_minutes):
+    try:
+        uploaded, failed, missing = FilesModel.retry_uploads(pending_after = timedelta(minutes = pending_minutes))
+        click.echo(f'Uploaded {len(uploaded)} files successfully, {len(failed)} failed again!')
+        if failed:
+            click.echo(f'Failed files: {", ".join(map(str, failed))}')
+        if missing:
+            click.echo(f'Files without data to retry (marked failed): {", ".join(map(str, missing))}')
+    except Exception as e:
+        click.echo(f'Error: {e}')
+
+
+@app.cli.command('export-timelogs')
+@click.option('--date-from', type=click.DateTime(formats=["%Y-%m-%d"]), default=None, help='First day (YYYY-MM-DD) of the export.')
+@click.option('--date-to', type=click.DateTime(formats=["%Y-%m-%d"]), default=None, help='Last day (YYYY-MM-DD) of the export.')
+@click.option('--staff-id', type=int, multiple=True, help='Export only this staff member, can be repeated.')
+@click.option('--format', 'export_format', type=click.Choice(list(TimeLogExporter.FORMATS)), default='csv', show_default=True, help='Output format.')
+@click.option('--output', type=click.File('w'), default='-', help='File to write the export to, stdout by default.')
+def export_timelogs(date_from, date_to, staff_id, export_format, output):
+    try:
+        exporter = TimeLogExporter(export_format = export_format, date_from = date_from.date() if date_from else None, date_to = date_to.date() if date_to else None, staff_ids = staff_id)
+        for chunk in exporter.stream():
+            output.write(chunk)
+    except Exception as e:
+        click.echo(f'Error: {e}', err=True)
+
+
+@app.cli.command('import-staff')
+@click.argument('file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--batch-size', default=500, show_default=True, help='Number of staff inserted per transaction.')
+def import_staff(file, batch_size):
+    try:
+        imported, errors = StaffImporter(batch_size = batch_size).run(file)
+        for line, fielderrors in errors:
+            click.echo(f'Line {line}: ' + "; ".join(f'{field}: {", ".join(messages)}' for field, messages in fielderrors.items()), err=True)
+        click.echo(f'Imported {imported} staff members, {len(errors)} rows failed!')
+    except Exception as e:
+        click.echo(f'Error: {e}')
+
+
+@app.cli.command('rebuild-attendance')
+@click.option('--date-from', type=click.DateTime(formats=["%Y-%m-%d"]), default=None, help='First day (YYYY-MM-DD) to rebuild, all days by default.')
+@click.option('--date-to', type=click.DateTime(formats=["%Y-%m-%d"]), default=None, help='Last day (YYYY-MM-DD) to rebuild, all days by default.')
+@click.option('--batch-size', default=200, show_default=True, help='Number of staff rebuilt per transaction.')
+def rebuild_attendance(date_from, date_to, batch_size):
+    try:
+        written = DailyAttendanceModel.rebuild(date_from = date_from.date() if date_from else None, date_to = date_to.date() if date_to else None, batch_size = batch_size)
+        click.echo(f'Rebuilt {written} daily attendance summaries successfully!')
+    except Exception as e:
+        click.echo(f'Error: {e}')
+
+
+@app.cli.command('backfill-work-dates')
+@click.option('--batch-size', default=200, show_default=True, help='Number of staff backfilled per transaction.')
+def backfill_work_dates(batch_size):
+    try:
+        filled, skipped = TimeLogModel.backfill_work_dates(batch_size = batch_size)
+        click.echo(f'Backfilled {filled} timelog work dates successfully, skipped {skipped} duplicate timelogs!')
+    except Exception as e:
+        click.echo(f'Error: {e}')
+
+
+@app.cli.command('backfill-timestamps')
+@click.option('--batch-size', default=1000, show_default=True, help='Number of rows repaired per transaction.')
+def backfill_timestamps(batch_size):
+    try:
+        for model, column, fields, derive in timestamp_backfills:
+            written = ModelUtil.backfill_frozen_column(db.session, model, column, fields, derive, batch_size = batch_size)
+            click.echo(f'Backfilled {written} {model.__tablename__}.{column} timestamps successfully!')
+    except Exception as e:
+        db.session.rollback()
+        click.echo(f'Error: {e}')
+
+
+@app.cli.command('prune-clock-requests')
+@click.option('--days', default=7, show_default=True, help='Remove idempotency keys older than this many days.')
+def prune_clock_requests(days):
+    try:
+        removed = ClockRequestModel.prune(older_than = timedelta(days = days))
+        click.echo(f'Pruned {removed} clock requests successfully!')
+    except Exception as e:
+        click.echo(f'Error: {e}')
+
+
+@app.cli.command('attendance-report')
+@click.option('--date-from', type=click.DateTime(formats=["%Y-%m-%d"]), required=True, help='First day (YYYY-MM-DD) of the report.')
+@click.option('--date-to', type=click.DateTime(formats=["%Y-%m-%d"]), required=True, help='Last day (YYYY-MM-DD) of the report.')
+@click.option('--period', type=click.Choice(AttendanceReport.PERIODS), default='month', show_default=True, help='Period the totals are grouped by.')
+@click.option('--staff-id', type=int, multiple=True, help='Report only this staff member, can be repeated.')
+@click.option('--output', type=click.File('w'), default='-', help='CSV file to write the report to, stdout by default.')
+def attendance_report(date_from, date_to, period, staff_id, output):
+    try:
+        report = AttendanceReport(date_from.date(), date_to.date(), period = period, staff_ids = staff_id)
+        writer = csv.DictWriter(output, fieldnames = AttendanceReport.FIELDS)
+        writer.writeheader()
+        writer.writerows(report.rows())
+    except Exception as e:
+        click.echo(f'Error: {e}', err=True)
+
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""Time of the monthly attendance report, its raw batch read of daily_attendance against reading the same select as Row objects, and the aggregation.
+
+    python -m benchmarks.attendance_report --staff 1000 --days 365
+"""
+import argparse
+from datetime import date, datetime, time, timedelta
+from time import perf_counter
+from sqlalchemy import select, extract
+from benchmarks.common import app, reset, make_staff, make_timelogs
+from admin.models import db, ScheduleModel, WeekOffModel, DailyAttendanceModel
+from admin.reports import AttendanceReport
+
+
+
+def timed(run):
+    started_at = perf_counter()
+    result = run()
+    return result, perf_counter() - started_at
+
+
+def seed(staff, days, first_day):
+    """staff members on a 9 to 5 schedule off on weekends, one timelog a day each, summarized by DailyAttendanceModel.rebuild."""
+    reset()
+    with app.app_context():
+        db.session.execute(ScheduleModel.__table__.insert(), [{"id": 1, "name": "general", "shift_type": "day", "shift_start": time(9), "shift_ends": time(17)}])
+        db.session.execute(WeekOffModel.__table__.insert(), [{"schedule_id": 1, "name": "saturday"}, {"schedule_id": 1, "name": "sunday"}])
+        db.session.commit()
+    timelogs = make_timelogs(make_staff(staff, schedule_id = 1), days, datetime.combine(first_day, time(9)))
+    with app.app_context():
+        summaries, seconds = timed(DailyAttendanceModel.rebuild)
+    return timelogs, summaries, seconds
+
+
+def row_read(report):
+    """The select of load_attendance read as SQLAlchemy Row objects through yield_per, the way Query reads go."""
+    statement = (select(DailyAttendanceModel.staff_id, extract("epoch", DailyAttendanceModel.first_in), extract("epoch", DailyAttendanceModel.last_out), DailyAttendanceModel.worked_seconds)
+                       .where(DailyAttendanceModel.date >= report.date_from, DailyAttendanceModel.date <= report.date_to))
+    return [tuple(row) for row in db.session.execute(statement).yield_per(report.batch_size)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--staff", type = int, default = 1000)
+    parser.add_argument("--days", type = int, default = 365)
+    args = parser.parse_args()
+
+    first_day = date(2025, 1, 1)
+    timelogs, summaries, rebuild = seed(args.staff, args.days, first_day)
+    print(f"{args.staff} staff x {args.days} days: {timelogs} timelogs, rebuilt into {summaries} daily summaries in {rebuild:.1f} s")
+
+    report = AttendanceReport(first_day, first_day + timedelta(days = args.days - 1), period = "month")
+    with app.app_context():
+        attendance, raw = timed(report.load_attendance)
+        _, rows = timed(lambda: row_read(report))
+        staff_ids, _, *schedules = report.load_staff()
+        _, aggregate = timed(lambda: report.aggregate(staff_ids, *schedules, *attendance, *report.load_offdays()))
+        report_rows, total = timed(lambda: list(report.rows()))
+    print(f"reading daily_attendance: raw batches {raw:.2f} s, Row objects via yield_per {rows:.2f} s")
+    print(f"aggregation: {aggregate:.2f} s")
+    print(f"{len(report_rows)} report rows end to end: {total:.2f} s")
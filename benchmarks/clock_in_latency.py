@@ -0,0 +1,46 @@
+"""Latency of concurrent clock-ins through POST /employee/api/timelog, with and without the group commit writer.
+
+    python -m benchmarks.clock_in_latency --clients 500
+"""
+import argparse
+import threading
+from time import monotonic
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.common import app, reset, make_staff, login, percentile, ms
+from admin.models import TimeLogModel, timelog_writer, principal_cache
+
+
+
+def run(clients, group_commit):
+    reset()
+    staff_ids = make_staff(clients)
+    principal_cache.clear()
+    TimeLogModel.group_commit = group_commit
+    batches = timelog_writer.stats()["batches"]
+    start = threading.Barrier(clients)
+
+    def clock_in(staff_id):
+        client = app.test_client()
+        login(client, staff_id)
+        start.wait()
+        started_at = monotonic()
+        response = client.post("/employee/api/timelog", json = {"clock_in": "2026-10-18 09:00:00"})
+        return response.status_code, monotonic() - started_at
+
+    with ThreadPoolExecutor(clients) as pool:
+        results = list(pool.map(clock_in, staff_ids))
+
+    latencies = [elapsed for _, elapsed in results]
+    errors = sum(status not in (200, 201) for status, _ in results)
+    label = "group commit" if group_commit else "commit per clock-in"
+    print(f"{label:<20} p50 {ms(percentile(latencies, 50)):>8}  p99 {ms(percentile(latencies, 99)):>8}  max {ms(max(latencies)):>8}  errors {errors}"
+          + (f"  batches {timelog_writer.stats()['batches'] - batches}" if group_commit else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--clients", type = int, default = 500, help = "concurrent clock-ins, one staff member each")
+    args = parser.parse_args()
+    print(f"{args.clients} concurrent clock-ins")
+    for group_commit in (True, False):
+        run(args.clients, group_commit)
@@ -0,0 +1,85 @@
+"""Shared setup of the benchmark scripts: a scratch sqlite database the app is configured for.
+
+Import it before anything of the app (the settings are read at import
+time); the environment already set wins, e.g. SQLITE_MODE=default.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+TMPDIR = tempfile.mkdtemp(prefix = "timescale-benchmark-")
+
+for key, value in {
+    "DATABASE_URL": "sqlite:///" + os.path.join(TMPDIR, "db.sqlite3"),
+    "DATABASE_REPLICA_URL": "",
+    "SQLITE_MODE": "tuned",
+    "SECRET_KEY": "benchmark",
+    "SESSION_BACKEND": "cookie",
+    "MINIO_URL": "127.0.0.1:9000",
+    "MINIO_USER": "minioadmin",
+    "MINIO_PWD": "minioadmin",
+    "APP_WRITE_LOGS": "0",
+    "APP_VIEW_LOGS": "0",
+}.items():
+    os.environ.setdefault(key, value)
+
+import logging
+from app import app
+from admin.models import db, StaffModel, TimeLogModel
+
+logging.disable(logging.INFO)
+app.config.update(WTF_CSRF_ENABLED = False)
+
+
+
+
+def reset():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+
+def make_staff(count, **overrides):
+    """Inserts count staff members with ids 1..count."""
+    with app.app_context():
+        for start in range(1, count + 1, 5000):
+            db.session.execute(StaffModel.__table__.insert(), [{"id": i, "registration_id": f"r{i}", "name": f"staff {i:06d}", "email": f"staff{i}@example.com", "gender": "male",
+                                                                "mobile": "9999999999", "password": "password", "address": "address", "pincode": 110001, "city": "city",
+                                                                "aadhar": f"{i:012d}", "registration_date": datetime(2024, 1, 1) + timedelta(minutes = i), **overrides}
+                                                               for i in range(start, min(start + 5000, count + 1))])
+        db.session.commit()
+    return list(range(1, count + 1))
+
+
+def make_timelogs(staff_ids, days, first_day = datetime(2025, 1, 1, 9)):
+    """Inserts one closed 8 hour timelog per staff per day, returns how many."""
+    rows = 0
+    with app.app_context():
+        for day in range(days):
+            clock_in = first_day + timedelta(days = day)
+            for start in range(0, len(staff_ids), 5000):
+                batch = staff_ids[start:start + 5000]
+                db.session.execute(TimeLogModel.__table__.insert(), [{"staff_id": staff_id, "clock_in": clock_in + timedelta(minutes = staff_id % 30), "clock_out": clock_in + timedelta(hours = 8),
+                                                                      "work_date": clock_in.date(), "updated_at": clock_in + timedelta(hours = 8)} for staff_id in batch])
+                rows += len(batch)
+        db.session.commit()
+    return rows
+
+
+def login(client, staff_id, user_type = "staff"):
+    with client.session_transaction() as session:
+        session["_user_id"] = str(staff_id)
+        session["_user_type_model"] = user_type
+        session["_fresh"] = True
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))] if values else None
+
+
+def ms(seconds):
+    return f"{seconds * 1000:.0f} ms"
@@ -0,0 +1,46 @@
+"""Latency of the current timelog lookup as the timelogs table grows, through ix_timelogs_staff_id_clock_in and as it was before the index.
+
+    python -m benchmarks.current_timelog_lookup --rows 10000,100000,500000
+"""
+import argparse
+import random
+from time import perf_counter
+from sqlalchemy import text
+from benchmarks.common import app, reset, make_staff, make_timelogs, percentile
+from admin.models import db, TimeLogModel
+
+
+
+def timed(lookup, staff_ids, repeat):
+    latencies = []
+    for staff_id in random.Random(0).choices(staff_ids, k = repeat):
+        started_at = perf_counter()
+        lookup(staff_id)
+        latencies.append(perf_counter() - started_at)
+    return latencies
+
+
+def unindexed_lookup(staff_id):
+    """The lookup before the index: the latest updated timelog of the staff, NOT INDEXED as the table had no index on staff_id then."""
+    return db.session.execute(text("SELECT * FROM timelogs NOT INDEXED WHERE staff_id = :staff_id ORDER BY updated_at DESC LIMIT 1"), {"staff_id": staff_id}).first()
+
+
+def run(rows, staff, repeat):
+    reset()
+    staff_ids = make_staff(staff)
+    make_timelogs(staff_ids, days = max(1, rows // staff))
+    with app.app_context():
+        indexed = timed(TimeLogModel.fetch_current_timelog, staff_ids, repeat)
+        before = timed(unindexed_lookup, staff_ids, max(1, repeat // 10))
+    print(f"{rows:>9} rows  indexed p50 {percentile(indexed, 50) * 1e6:>7.0f} us  p99 {percentile(indexed, 99) * 1e6:>7.0f} us"
+          f"  |  before the index p50 {percentile(before, 50) * 1e3:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--rows", default = "10000,100000,500000", help = "comma separated table sizes")
+    parser.add_argument("--staff", type = int, default = 1000)
+    parser.add_argument("--repeat", type = int, default = 1000, help = "lookups per size (a tenth of them before the index)")
+    args = parser.parse_args()
+    for rows in map(int, args.rows.split(",")):
+        run(rows, args.staff, args.repeat)
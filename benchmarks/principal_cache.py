@@ -0,0 +1,46 @@
+"""Statements and latency of authenticated requests with the principal_cache warm, and with it cleared before every request as the per-request load_user did.
+
+    python -m benchmarks.principal_cache --requests 1000
+"""
+import argparse
+import io
+from contextlib import redirect_stdout
+from time import perf_counter
+from benchmarks.common import app, reset, login, percentile
+from admin.models import db, AdminModel, principal_cache
+from utils.utilities import ModelUtil
+
+
+
+def run(requests, cold):
+    """GETs /admin/metrics, which itself reads nothing from the database, so every statement counted is the identity load."""
+    latencies = []
+    with app.test_client() as client:
+        login(client, 1, user_type = "admin")
+        client.get("/admin/metrics")
+        with app.app_context():
+            engine = db.engine
+        with ModelUtil.count_queries(engine) as queries:
+            for _ in range(requests):
+                if cold:
+                    principal_cache.clear()
+                started_at = perf_counter()
+                response = client.get("/admin/metrics")
+                latencies.append(perf_counter() - started_at)
+                assert response.status_code == 200, response.status_code
+    return len(queries), latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--requests", type = int, default = 1000)
+    args = parser.parse_args()
+
+    reset()
+    with app.app_context():
+        db.session.add(AdminModel(id = 1, name = "admin", email = "admin@example.com", password = "password"))
+        db.session.commit()
+    for name, cold in (("principal_cache", False), ("load per request", True)):
+        with redirect_stdout(io.StringIO()):  # manager_required prints on every request
+            statements, latencies = run(args.requests, cold)
+        print(f"{name:<17} {statements:>6} statements / {args.requests} requests  p50 {percentile(latencies, 50) * 1e3:.2f} ms  p99 {percentile(latencies, 99) * 1e3:.2f} ms")
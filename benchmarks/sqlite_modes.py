@@ -0,0 +1,83 @@
+"""Throughput and p95 latency of concurrent clock-in writers and timelog readers with SQLITE_MODE=default and SQLITE_MODE=tuned.
+
+    python -m benchmarks.sqlite_modes --threads 8 --seconds 6
+
+The mode is read when the app is imported, so each one runs in a subprocess
+of this script (--mode) on a database of its own.
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import threading
+from datetime import datetime, timedelta
+from time import perf_counter
+
+
+
+def worker(app, operation, deadline, latencies, errors, seed):
+    """Repeats operation until the deadline inside an app context of the thread, recording each call's latency or counting its failure."""
+    from admin.models import db
+    rng = random.Random(seed)
+    with app.app_context():
+        while perf_counter() < deadline:
+            started_at = perf_counter()
+            try:
+                operation(rng)
+                latencies.append(perf_counter() - started_at)
+            except Exception:
+                db.session.rollback()
+                errors.append(1)
+
+
+def run(threads, seconds, staff, days):
+    from sqlalchemy import func
+    from benchmarks.common import app, reset, make_staff, make_timelogs, percentile
+    from admin.models import db, TimeLogModel
+
+    reset()
+    staff_ids = make_staff(staff)
+    first_day = datetime.combine(datetime.today() - timedelta(days = days), datetime.min.time()) + timedelta(hours = 9)
+    make_timelogs(staff_ids, days, first_day)
+    TimeLogModel.group_commit = False
+
+    def write(rng):
+        TimeLogModel.clock_timelog(rng.choice(staff_ids), clock_in = datetime.now())
+
+    def read(rng):
+        TimeLogModel.fetch_timelog(staff_id = rng.choice(staff_ids), page_size = 20)
+        (db.session.query(TimeLogModel.staff_id, func.count(TimeLogModel.id), func.max(TimeLogModel.clock_out))
+                   .filter(TimeLogModel.clock_in >= datetime.now() - timedelta(days = 30)).group_by(TimeLogModel.staff_id).all())
+        db.session.commit()
+
+    results = {"write": ([], []), "read": ([], [])}
+    deadline = perf_counter() + seconds
+    workers = [threading.Thread(target = worker, args = (app, operation, deadline, *results[name], index))
+               for name, operation in (("write", write), ("read", read)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    (writes, write_errors), (reads, read_errors) = results["write"], results["read"]
+    print(f"{os.environ['SQLITE_MODE']:<8} {len(writes) / seconds:>8.1f} {percentile(writes, 95) * 1e3:>7.0f} ms {len(write_errors):>7} |"
+          f" {len(reads) / seconds:>7.1f} {percentile(reads, 95) * 1e3:>7.0f} ms {len(read_errors):>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--threads", type = int, default = 8, help = "writer threads, and as many reader threads")
+    parser.add_argument("--seconds", type = float, default = 6)
+    parser.add_argument("--staff", type = int, default = 2000)
+    parser.add_argument("--days", type = int, default = 30)
+    parser.add_argument("--mode", choices = ("default", "tuned"), help = "run a single mode in this process")
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.threads, args.seconds, args.staff, args.days)
+    else:
+        print("mode     writes/s  write p95  errors | reads/s  read p95  errors")
+        for mode in ("default", "tuned"):
+            command = [sys.executable, "-m", "benchmarks.sqlite_modes", "--mode", mode] + [f"--{name}={getattr(args, name)}" for name in ("threads", "seconds", "staff", "days")]
+            subprocess.run(command, env = {**os.environ, "SQLITE_MODE": mode}, check = True)
@@ -0,0 +1,45 @@
+"""Peak Python memory of reading every timelog of one staff member, streamed through iter_timelog and listed through fetch_timelog.
+
+    python -m benchmarks.stream_memory --rows 20000,100000
+"""
+import argparse
+import tracemalloc
+from collections import deque
+from datetime import datetime, timedelta
+from benchmarks.common import app, reset, make_staff
+from admin.models import db, TimeLogModel
+
+
+
+def seed(rows):
+    """One closed timelog a day for staff 1, inserted in chunks as make_timelogs goes per day."""
+    reset()
+    make_staff(1)
+    first_day = datetime(2025, 1, 1, 9)
+    with app.app_context():
+        for start in range(0, rows, 5000):
+            db.session.execute(TimeLogModel.__table__.insert(), [{"staff_id": 1, "clock_in": first_day + timedelta(days = day), "clock_out": first_day + timedelta(days = day, hours = 8),
+                                                                  "work_date": (first_day + timedelta(days = day)).date(), "updated_at": first_day + timedelta(days = day, hours = 8)}
+                                                                 for day in range(start, min(start + 5000, rows))])
+        db.session.commit()
+
+
+def peak(read):
+    with app.app_context():
+        tracemalloc.start()
+        try:
+            read()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--rows", default = "20000,100000", help = "comma separated timelog counts")
+    args = parser.parse_args()
+    for rows in map(int, args.rows.split(",")):
+        seed(rows)
+        streamed = peak(lambda: deque(TimeLogModel.iter_timelog(staff_ids = [1]), maxlen = 0))
+        listed = peak(lambda: TimeLogModel.fetch_timelog(staff_id = 1))
+        print(f"{rows:>7} rows  iter_timelog {streamed / 2 ** 20:>6.1f} MB  fetch_timelog {listed / 2 ** 20:>6.1f} MB")
@@ -9,4 +9,5 @@ staff = Blueprint("staff", __name__, static_folder="static", template_folder="te
 
 staff.add_url_rule("/", view_func=views.StaffIndexView.as_view("staffindex"))
 staff.add_url_rule("/signin", view_func=views.StaffSignin.as_view("signin"))
-staff.add_url_rule("/timelog/add", view_func=views.AddTimeLog.as_view("addtimelog"))
\ No newline at end of file
+staff.add_url_rule("/timelog/add", view_func=views.AddTimeLog.as_view("addtimelog"))
+staff.add_url_rule("/api/timelog", view_func=views.TimeLogAPI.as_view("timelogapi"))
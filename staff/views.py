@@ -1,9 +1,13 @@
-from flask import redirect, flash, render_template, url_for, request, session
+import os
+from flask import redirect, flash, render_template, url_for, request, session, jsonify, current_app
 from flask.views import MethodView
 from flask_login import login_user, logout_user, login_required, current_user
+from flask_wtf.csrf import generate_csrf
 from admin.forms import SigninForm, TimeLogForm
-from admin.models import StaffModel, TimeLogModel, ScheduleModel
+from admin.models import StaffModel, TimeLogModel, ClockRequestModel, shift_calendar
 from dateutil import parser as dateutilparser
+from werkzeug.datastructures import FileStorage
+from utils.utilities import ImageUtil
 from datetime import datetime
 
 
@@ -79,13 +83,17 @@ class AddTimeLog(MethodView):
     def get(self):
         clock_in_time = None
         clock_out_time = None
+        form = TimeLogForm()
+        blockcondition = False
         if getattr(current_user,"schedule_id", None):
-            schedule = ScheduleModel.fetch_schedule(id = current_user.schedule_id, first_only = True)
-            hoursdelta = (datetime.now() - datetime.combine(datetime.now(), schedule['shift_start'])).total_seconds() / 3600
-            blockcondition = abs(hoursdelta) > 1
-            form = TimeLogForm()
             if bool(getattr(current_user, "is_admin", None)):
                 return redirect(url_for("admin.signin"))
+            shift = shift_calendar.shift(current_user.schedule_id)
+            if shift is None or not shift_calendar.is_expected(current_user.id, current_user.schedule_id):
+                blockcondition = True
+            else:
+                hoursdelta = (datetime.now() - datetime.combine(datetime.now(), shift[0])).total_seconds() / 3600
+                blockcondition = abs(hoursdelta) > 1
             
             timelog = TimeLogModel.fetch_timelog(staff_id = current_user.id, current = True)
             if timelog and timelog['clock_in'].date() == datetime.now().date():
@@ -102,12 +110,8 @@ class AddTimeLog(MethodView):
         try:
             form = TimeLogForm()
             if form.validate_on_submit(request = request):
-                timelog = TimeLogModel.fetch_timelog(staff_id = current_user.id, current = True)
-                if timelog and timelog['clock_in'].date() == datetime.now().date():
-                    updated_form_data = {**form.data, "id": timelog['id']}
-                    TimeLogModel.update_timelog(**updated_form_data)
-                else:
-                    TimeLogModel.add_timelog(**form.data, staff_id = current_user.id)
+                key = request.headers.get("Idempotency-Key", "")[:ClockRequestModel.MAX_KEY_LENGTH]
+                TimeLogModel.clock_timelog(staff_id = current_user.id, idempotency_key = key or None, **form.data)
                 flash(message="Successfully Added Timelog Entry", category="success")
                 return redirect(url_for("staff.staffindex"))
             else:
@@ -116,4 +120,82 @@ class AddTimeLog(MethodView):
         except Exception as e:
             flash(message="Failed to Add Timelog Entry", category=getattr(e, "category", "error"))
             return render_template("staff/addtimelog.html", form = form)
-        
\ No newline at end of file
+
+
+
+
+class TimeLogAPI(MethodView):
+    """Clock-in/clock-out for kiosks and mobile clients.
+
+    Accepts multipart/form-data with clock_in/clock_out fields and the raw
+    image bytes (jpeg, png or webp) as the picture part, or a json body
+    without a picture. Posts are csrf protected like the rest of the app:
+    clients get a token from GET and send it in the X-CSRFToken header.
+    """
+
+    exts = ("jpeg", "jpg", "png", "webp")
+
+
+    @login_required
+    def get(self):
+        return jsonify({"csrf_token": generate_csrf()})
+
+
+    @login_required
+    def post(self):
+        try:
+            if bool(getattr(current_user, "is_admin", None)):
+                return jsonify({"error": "Timelogs can only be added for staff members"}), 403
+
+            payload = request.get_json(silent = True) if request.is_json else request.form
+            if payload is None:
+                return jsonify({"error": "Invalid json body"}), 400
+
+            data = {}
+            for field in ("clock_in", "clock_out"):
+                value = payload.get(field)
+                if value not in (None, "", "None"):
+                    data[field] = dateutilparser.parse(str(value))
+
+            if not data:
+                return jsonify({"error": "clock_in or clock_out is required"}), 400
+
+            picture = request.files.get("picture")
+            if picture is not None and picture.filename:
+                error = self.validate_picture(picture)
+                if error:
+                    return jsonify({"error": error}), 400
+                data["picture"] = picture
+
+            key = request.headers.get("Idempotency-Key")
+            if key:
+                if len(key) > ClockRequestModel.MAX_KEY_LENGTH:
+                    return jsonify({"error": f"Idempotency-Key should be at most {ClockRequestModel.MAX_KEY_LENGTH} characters"}), 400
+                data["idempotency_key"] = key
+
+            timelog_id, is_open = TimeLogModel.clock_timelog(staff_id = current_user.id, **data)
+            return jsonify({"id": timelog_id, "action": "clock_in" if is_open else "clock_out"}), 201 if is_open else 200
+
+        except (ValueError, OverflowError):
+            return jsonify({"error": "Invalid clock_in/clock_out datetime"}), 400
+        except Exception as e:
+            current_app.logger.exception(f"Failed to add timelog of staff: {current_user.id}")
+            return jsonify({"error": "Failed to Add Timelog Entry"}), 500
+
+
+    def validate_picture(self, picture: FileStorage):
+        ext = picture.filename.rsplit(".", 1)[-1].lower() if "." in picture.filename else picture.mimetype.rsplit("/", 1)[-1]
+        if ext not in self.exts:
+            return f"Image with extension {ext} not allowed. Pls upload the image with following extensions: ({', '.join(self.exts)})"
+
+        picture.stream.seek(0, os.SEEK_END)
+        size = picture.stream.tell()
+        picture.stream.seek(0, os.SEEK_SET)
+        if size == 0 or size > TimeLogForm.max_picture_size * 1000 * 1000:
+            return f"Image Size should be between 1 byte and {TimeLogForm.max_picture_size} MB"
+
+        if not ImageUtil.has_signature(picture.stream.read(12), ext):
+            return "Invalid image data"
+        picture.stream.seek(0, os.SEEK_SET)
+        picture.filename = f"clock_in_photo.{ext}"
+        return None
@@ -0,0 +1,146 @@
+import os
+import sys
+import tempfile
+import pytest
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+TMPDIR = tempfile.mkdtemp(prefix = "timescale-tests-")
+
+os.environ.update({
+    "DATABASE_URL": "sqlite:///" + os.path.join(TMPDIR, "db.sqlite3"),
+    "DATABASE_REPLICA_URL": "",
+    "SQLITE_MODE": "tuned",
+    "DB_POOL_SIZE": "2",
+    "DB_MAX_OVERFLOW": "2",
+    "DB_POOL_TIMEOUT": "10",
+    "SECRET_KEY": "tests",
+    "SESSION_BACKEND": "cookie",
+    "MINIO_URL": "127.0.0.1:9000",
+    "MINIO_USER": "minioadmin",
+    "MINIO_PWD": "minioadmin",
+    "APP_WRITE_LOGS": "0",
+    "APP_VIEW_LOGS": "0",
+    "UPLOAD_SPOOL_DIR": os.path.join(TMPDIR, "spool"),
+})
+
+from app import app as flaskapp
+from admin.models import db, StaffModel, principal_cache, schedule_cache, shift_calendar
+
+
+
+
+class FakeMinio:
+    """Stand in for the minio client that records the calls made to it."""
+
+    def __init__(self, buckets = ()):
+        self.buckets = set(buckets)
+        self.objects = {}
+        self.locations = {}
+        self.calls = {}
+        self.failures = 0
+
+
+    def count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+
+    def bucket_exists(self, bucket_name):
+        self.count("bucket_exists")
+        return bucket_name in self.buckets
+
+
+    def list_buckets(self):
+        self.count("list_buckets")
+        return [type("Bucket", (), {"name": name})() for name in self.buckets]
+
+
+    def remove_object(self, bucket_name, object_name):
+        self.count("remove_object")
+        self.objects.pop((bucket_name, object_name), None)
+
+
+    def make_bucket(self, bucket_name, location = None):
+        self.count("make_bucket")
+        self.buckets.add(bucket_name)
+        self.locations[bucket_name] = location
+
+
+    def put_object(self, bucket_name, object_name, data, length, part_size = None, content_type = None):
+        self.count("put_object")
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("minio is unreachable")
+        self.objects[(bucket_name, object_name)] = data.read(length)
+
+
+    def get_presigned_url(self, method, bucket_name, object_name, expires = None):
+        self.count("get_presigned_url")
+        return f"http://minio/{bucket_name}/{object_name}"
+
+
+
+
+@pytest.fixture(scope = "session")
+def app():
+    flaskapp.config.update(TESTING = True, WTF_CSRF_ENABLED = False)
+    return flaskapp
+
+
+@pytest.fixture(autouse = True)
+def database(app):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    principal_cache.clear()
+    schedule_cache.clear()
+    shift_calendar.invalidate()
+    yield db
+    with app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def fake_minio(monkeypatch):
+    from admin.models import minio
+    from utils.utilities import MinioDB
+    client = FakeMinio()
+    monkeypatch.setattr(minio, "minioClient", client)
+    monkeypatch.setattr(MinioDB, "known_buckets", set())
+    monkeypatch.setattr(MinioDB, "_buckets_loaded", False)
+    MinioDB.link_cache.clear()
+    return client
+
+
+def make_staff(count = 1, start = 1, **overrides):
+    """Inserts count staff members with ids start.. and returns their ids."""
+    rows = [{"id": i, "registration_id": f"r{i}", "name": f"staff {i}", "email": f"staff{i}@example.com", "gender": "male", "mobile": "9999999999",
+             "password": "password", "address": "address", "pincode": 110001, "city": "city", "aadhar": f"{i:012d}", **overrides} for i in range(start, start + count)]
+    db.session.execute(StaffModel.__table__.insert(), rows)
+    db.session.commit()
+    return [row["id"] for row in rows]
+
+
+def login(client, staff_id, user_type = "staff"):
+    with client.session_transaction() as session:
+        session["_user_id"] = str(staff_id)
+        session["_user_type_model"] = user_type
+        session["_fresh"] = True
+
+
+def query_plans(table, run):
+    """Calls run() and returns the EXPLAIN QUERY PLAN details of the selects from table it executed."""
+    selects = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT") and f"FROM {table}" in statement:
+            selects.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        run()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+    with db.engine.connect() as connection:
+        return [" / ".join(row[-1] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)) for statement, parameters in selects]
@@ -0,0 +1,24 @@
+from datetime import datetime, date, time
+from admin.models import db, ScheduleModel, WeekOffModel, OffDayModel, timestamp_backfills
+from utils.utilities import ModelUtil
+from tests.conftest import make_staff
+
+
+
+def test_frozen_schedule_week_off_and_off_day_timestamps_are_ordered_by_insertion(app):
+    frozen = datetime(2025, 1, 1, 9)
+    with app.app_context():
+        make_staff(2)
+        db.session.execute(ScheduleModel.__table__.insert(), [{"id": i, "name": f"schedule {i}", "shift_type": "day", "shift_start": time(9), "shift_ends": time(17), "updated_at": frozen} for i in (1, 2)])
+        db.session.execute(WeekOffModel.__table__.insert(), [{"name": "sunday", "schedule_id": i, "updated_at": frozen} for i in (1, 2)])
+        db.session.execute(OffDayModel.__table__.insert(), [{"date": date(2025, 1, i), "off_type": "leave", "staff_id": 1, "day_of_week": "monday", "approver_id": 2,
+                                                             "requested_at": frozen, "approved_at": frozen, "updated_at": frozen} for i in (6, 7)])
+        db.session.commit()
+
+        written = {model.__tablename__: ModelUtil.backfill_frozen_column(db.session, model, column, fields, derive) for model, column, fields, derive in timestamp_backfills}
+        assert (written["schedule"], written["weekoff"], written["offday"]) == (2, 2, 2)
+
+        for model in (ScheduleModel, WeekOffModel, OffDayModel):
+            stamps = [updated_at for _, updated_at in db.session.query(model.id, model.updated_at).order_by(model.id)]
+            assert stamps == sorted(set(stamps)) and len(stamps) == 2
+            assert ModelUtil.backfill_frozen_column(db.session, model, "updated_at", ("id", "updated_at"), lambda row_id, value: value) == 0
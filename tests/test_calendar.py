@@ -0,0 +1,78 @@
+from datetime import date, time, timedelta
+from admin.models import db, ScheduleModel, WeekOffModel, OffDayModel, shift_calendar
+from utils.utilities import ModelUtil
+from tests.conftest import make_staff
+
+
+
+def add_schedule():
+    db.session.add(ScheduleModel(id = 1, name = "morning", shift_type = "day", shift_start = time(9), shift_ends = time(17)))
+    db.session.add(WeekOffModel(name = "sunday", schedule_id = 1))
+    db.session.commit()
+
+
+def counts():
+    stats = shift_calendar.stats()
+    return stats["hits"], stats["misses"]
+
+
+def test_schedule_lookups_are_cached_with_hit_and_miss_counts(app):
+    monday = date.today() - timedelta(days = date.today().weekday())
+    with app.app_context():
+        add_schedule()
+        make_staff(1, schedule_id = 1)
+        hits, misses = counts()
+
+        assert shift_calendar.shift(1) == (time(9), time(17))
+        with ModelUtil.count_queries(db.engine, expected = 0):
+            for _ in range(100):
+                assert shift_calendar.shift(1) == (time(9), time(17))
+                assert shift_calendar.is_expected(1, 1, monday)
+                assert not shift_calendar.is_expected(1, 1, monday + timedelta(days = 6))
+        assert counts() == (hits + 300, misses + 1)
+
+        ScheduleModel.update_schedule(id = 1, shift_start = time(10))
+        assert shift_calendar.shift(1) == (time(10), time(17))
+        assert counts() == (hits + 300, misses + 2)
+
+
+def test_off_day_writes_invalidate_the_calendar(app):
+    monday = date.today() - timedelta(days = date.today().weekday())
+    with app.app_context():
+        add_schedule()
+        make_staff(2, schedule_id = 1)
+        assert shift_calendar.is_expected(1, 1, monday)
+
+        offday = OffDayModel(date = monday, off_type = "leave", staff_id = 1, day_of_week = "monday", approver_id = 2)
+        db.session.add(offday)
+        db.session.flush()
+        assert shift_calendar.is_expected(1, 1, monday)
+        db.session.commit()
+        assert not shift_calendar.is_expected(1, 1, monday)
+
+        db.session.delete(offday)
+        db.session.commit()
+        assert shift_calendar.is_expected(1, 1, monday)
+
+        db.session.add(OffDayModel(date = monday, off_type = "leave", staff_id = 1, day_of_week = "monday", approver_id = 2))
+        db.session.flush()
+        db.session.rollback()
+        builds = shift_calendar.stats()["builds"]
+        assert shift_calendar.is_expected(1, 1, monday)
+        assert shift_calendar.stats()["builds"] == builds
+
+
+def test_an_invalidate_racing_a_build_keeps_it_stale(app, monkeypatch):
+    with app.app_context():
+        add_schedule()
+        query = db.session.query
+
+        def invalidate_midway(*args):
+            shift_calendar.invalidate()
+            monkeypatch.setattr(db.session, "query", query)
+            return query(*args)
+        monkeypatch.setattr(db.session, "query", invalidate_midway)
+
+        assert shift_calendar.ensure()[1]
+        assert shift_calendar.ensure()[1]
+        assert not shift_calendar.ensure()[1]
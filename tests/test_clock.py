@@ -0,0 +1,96 @@
+import io
+import uuid
+import pytest
+from time import sleep
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from admin.models import db, TimeLogModel, ClockRequestModel, DailyAttendanceModel, FilesModel
+from tests.conftest import make_staff, login
+
+
+
+@pytest.fixture(params = [False, True], ids = ["direct", "group_commit"])
+def group_commit(request, monkeypatch):
+    monkeypatch.setattr(TimeLogModel, "group_commit", request.param)
+    return request.param
+
+
+def clock(app, staff_id, key = None, **kwargs):
+    with app.app_context():
+        return TimeLogModel.clock_timelog(staff_id, idempotency_key = key, **kwargs)
+
+
+def png():
+    output = io.BytesIO()
+    Image.new("RGB", (32, 32), "red").save(output, "PNG")
+    return output.getvalue()
+
+
+def test_parallel_clock_ins_of_one_staff_converge_on_one_timelog(app, group_commit):
+    now = datetime.now().replace(microsecond = 0)
+    with app.app_context():
+        make_staff(1)
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda i: clock(app, 1, clock_in = now + timedelta(seconds = i), clock_out = None), range(40)))
+
+    assert len({timelog_id for timelog_id, _ in results}) == 1
+    assert all(is_open for _, is_open in results)
+    with app.app_context():
+        timelogs = db.session.query(TimeLogModel.work_date, TimeLogModel.clock_out).all()
+        assert timelogs == [(now.date(), None)]
+        assert db.session.query(DailyAttendanceModel.timelog_count, DailyAttendanceModel.status).all() == [(1, "open")]
+
+
+def test_parallel_retries_of_one_key_are_applied_once(app, group_commit):
+    now = datetime.now().replace(microsecond = 0)
+    with app.app_context():
+        make_staff(1)
+    clock(app, 1, clock_in = now)
+    key = str(uuid.uuid4())
+
+    with ThreadPoolExecutor(8) as pool:
+        results = set(pool.map(lambda i: clock(app, 1, key, clock_in = now, clock_out = now + timedelta(hours = 8, seconds = i)), range(40)))
+
+    assert len(results) == 1 and not next(iter(results))[1]
+    with app.app_context():
+        assert db.session.query(TimeLogModel).count() == 1
+        assert db.session.query(ClockRequestModel).count() == 1
+
+
+def test_clock_out_after_midnight_closes_the_night_shift(app, group_commit):
+    today = datetime.now().replace(hour = 6, minute = 0, second = 0, microsecond = 0)
+    with app.app_context():
+        make_staff(1)
+    timelog_id, is_open = clock(app, 1, clock_in = today - timedelta(hours = 8))
+    assert is_open
+
+    assert clock(app, 1, clock_out = today) == (timelog_id, False)
+    with app.app_context():
+        assert db.session.query(TimeLogModel.id, TimeLogModel.work_date, TimeLogModel.clock_out).all() == [(timelog_id, (today - timedelta(days = 1)).date(), today)]
+
+    timelog_id, is_open = clock(app, 1, clock_out = today + timedelta(hours = 1))
+    assert not is_open
+    with app.app_context():
+        assert db.session.query(TimeLogModel.work_date).filter_by(id = timelog_id).scalar() == today.date()
+
+
+def test_retry_with_the_same_key_uploads_nothing(app, fake_minio, group_commit):
+    with app.app_context():
+        make_staff(1)
+    client = app.test_client()
+    login(client, 1)
+
+    responses = [client.post("/employee/api/timelog", data = {"clock_in": "2026-10-18 09:00:00", "picture": (io.BytesIO(png()), "photo.png")},
+                             headers = {"Idempotency-Key": "retry"}, content_type = "multipart/form-data") for _ in range(3)]
+
+    assert {(response.status_code, response.json["id"]) for response in responses} == {(201, responses[0].json["id"])}
+    with app.app_context():
+        for _ in range(100):
+            if db.session.query(FilesModel.status).scalar() != "pending":
+                break
+            db.session.rollback()
+            sleep(0.05)
+        assert db.session.query(FilesModel.status).all() == [("uploaded",)]
+    assert fake_minio.calls["put_object"] == 2
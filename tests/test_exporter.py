@@ -0,0 +1,34 @@
+from datetime import datetime, date, timedelta
+from admin.models import db, TimeLogModel
+from admin.exporter import TimeLogExporter
+from tests.conftest import make_staff, query_plans
+
+
+
+def add_timelogs(count, staff_ids = (1, 2)):
+    start = datetime(2025, 9, 1, 9)
+    rows = [{"staff_id": staff_ids[i % len(staff_ids)], "clock_in": start + timedelta(days = i // len(staff_ids)), "updated_at": start} for i in range(count)]
+    db.session.execute(TimeLogModel.__table__.insert(), [{**row, "work_date": row["clock_in"].date()} for row in rows])
+    db.session.commit()
+
+
+def test_export_walks_the_clock_in_index(app):
+    with app.app_context():
+        make_staff(2)
+        add_timelogs(20)
+
+        for exporter in (TimeLogExporter(), TimeLogExporter(date_from = date(2025, 9, 1), date_to = date(2025, 9, 1))):
+            [plan] = query_plans("timelogs", lambda: "".join(exporter.stream()))
+            assert "ix_timelogs_clock_in_id" in plan
+            assert "TEMP B-TREE" not in plan
+
+
+def test_header_and_first_batch_are_yielded_right_away(app):
+    with app.app_context():
+        make_staff(2)
+        add_timelogs(5)
+
+        chunks = list(TimeLogExporter(batch_size = 2).stream())
+
+    assert [chunk.count("\n") for chunk in chunks] == [1, 2, 3]
+    assert chunks[0].startswith("id,staff_id,staff_name")
@@ -0,0 +1,65 @@
+import threading
+import pytest
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from time import monotonic, sleep
+from admin.models import db, TimeLogModel, principal_cache, timelog_writer
+from tests.conftest import make_staff, login
+
+
+
+def test_cold_cache_clock_ins_beyond_the_pool_size(app):
+    """Every request loads its principal (load_user) and then waits on the group commit writer, with more requests than pooled connections."""
+    clients = 3 * (int(app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_size"]) + int(app.config["SQLALCHEMY_ENGINE_OPTIONS"]["max_overflow"]))
+    with app.app_context():
+        staff_ids = make_staff(clients)
+    principal_cache.clear()
+
+    def clock_in(staff_id):
+        client = app.test_client()
+        login(client, staff_id)
+        started_at = monotonic()
+        response = client.post("/employee/api/timelog", json = {"clock_in": "2026-10-18 09:00:00"})
+        return response.status_code, monotonic() - started_at
+
+    with ThreadPoolExecutor(clients) as pool:
+        results = list(pool.map(clock_in, staff_ids))
+
+    assert [status for status, _ in results] == [201] * clients
+    assert max(elapsed for _, elapsed in results) < 5
+    with app.app_context():
+        assert db.session.query(TimeLogModel).count() == clients
+
+
+def test_a_clock_in_that_times_out_in_the_queue_is_never_written(app, monkeypatch):
+    with app.app_context():
+        make_staff(2)
+    monkeypatch.setattr(TimeLogModel, "group_commit", True)
+    monkeypatch.setattr(TimeLogModel, "group_commit_timeout", 0.2)
+    started, release = threading.Event(), threading.Event()
+    clock_batch = TimeLogModel.clock_batch.__func__
+
+    def stalled_clock_batch(cls, items):
+        started.set()
+        release.wait(5)
+        return clock_batch(cls, items)
+    monkeypatch.setattr(TimeLogModel, "clock_batch", classmethod(stalled_clock_batch))
+
+    def clock_in(staff_id):
+        with app.app_context():
+            return TimeLogModel.clock_timelog(staff_id, clock_in = datetime(2026, 10, 18, 9))
+
+    with ThreadPoolExecutor(1) as pool:
+        running = pool.submit(clock_in, 1)
+        assert started.wait(5)
+        with pytest.raises(FutureTimeoutError):
+            clock_in(2)
+        release.set()
+        assert running.result(5)[1]
+
+    with app.app_context():
+        assert db.session.query(TimeLogModel.staff_id).all() == [(1,)]
+    deadline = monotonic() + 5
+    while timelog_writer.stats()["cancelled"] < 1 and monotonic() < deadline:
+        sleep(0.01)
+    assert timelog_writer.stats()["cancelled"] >= 1
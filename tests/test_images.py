@@ -0,0 +1,26 @@
+import io
+import base64
+import pytest
+from PIL import Image
+from utils.utilities import ImageUtil
+from utils.errors import FormValidationError
+
+
+
+def data_url(extra):
+    output = io.BytesIO()
+    Image.new("RGB", (16, 16), "blue").save(output, "PNG")
+    data = output.getvalue() + b"\0" * extra
+    return data, "data:image/png;base64," + base64.b64encode(data).decode()
+
+
+@pytest.mark.parametrize("extra", [0, 1, 2])
+def test_decoded_size_accounts_for_the_padding(extra):
+    data, url = data_url(extra)
+    assert url.endswith("=" * ((3 - len(data) % 3) % 3))
+
+    image, ext, size = ImageUtil.decode_data_url(url, max_size = len(data))
+    assert (image.read(), ext, size) == (data, "png", len(data))
+
+    with pytest.raises(FormValidationError):
+        ImageUtil.decode_data_url(url, max_size = len(data) - 1)
@@ -0,0 +1,32 @@
+import io
+import csv
+from datetime import time
+from admin.models import db, StaffModel, ScheduleModel
+from admin.importer import StaffImporter
+from utils.utilities import ModelUtil
+
+
+
+def staff_csv(rows):
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames = StaffImporter.COLUMNS)
+    writer.writeheader()
+    for i, schedule in rows:
+        writer.writerow({"name": f"staff {i}", "gender": "male", "dob": "1990-01-01", "email": f"staff{i}@example.com", "mobile": "9999999999", "aadhar": f"{i:012d}",
+                         "address": "address", "pincode": "110001", "city": "city", "schedule": schedule})
+    output.seek(0)
+    return output
+
+
+def test_mixed_schedule_batch_is_inserted_with_one_statement(app):
+    with app.app_context():
+        db.session.add(ScheduleModel(id = 1, name = "morning", shift_type = "day", shift_start = time(9), shift_ends = time(17)))
+        db.session.commit()
+
+        importer = StaffImporter(batch_size = 10)
+        with ModelUtil.count_queries(db.engine) as statements:
+            imported, errors = importer.run(staff_csv([(i, "1" if i % 2 else "") for i in range(1, 7)]))
+
+        assert (imported, errors) == (6, [])
+        assert len([statement for statement in statements if statement.startswith("INSERT INTO staff")]) == 1
+        assert dict(db.session.query(StaffModel.id, StaffModel.schedule_id).order_by(StaffModel.id).all()) == {1: 1, 2: None, 3: 1, 4: None, 5: 1, 6: None}
@@ -0,0 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+from admin.models import minio
+
+
+
+def test_buckets_are_checked_once_per_process(fake_minio):
+    fake_minio.buckets.add("existing")
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(minio.create_bucket, ["existing", "timelogs"] * 50))
+
+    assert fake_minio.calls == {"list_buckets": 1, "bucket_exists": 1, "make_bucket": 1}
+    assert fake_minio.buckets == {"existing", "timelogs"}
+
+    minio.create_bucket("existing")
+    minio.create_bucket("timelogs")
+    assert fake_minio.calls == {"list_buckets": 1, "bucket_exists": 1, "make_bucket": 1}
+
+
+def test_buckets_are_created_in_the_signing_region(fake_minio, monkeypatch):
+    monkeypatch.setattr(minio, "region", "ap-south-1")
+    minio.create_bucket("images")
+    assert fake_minio.locations == {"images": "ap-south-1"}
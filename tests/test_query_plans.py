@@ -0,0 +1,36 @@
+import pytest
+from datetime import datetime, timedelta
+from admin.models import db, StaffModel, TimeLogModel
+from tests.conftest import make_staff, query_plans
+
+
+
+@pytest.mark.parametrize("sort_by, index", [("name", "ix_staff_name_id"), ("registration_date", "ix_staff_registration_date_id")])
+@pytest.mark.parametrize("sort_order", ["asc", "desc"])
+@pytest.mark.parametrize("get_references", [False, True])
+def test_staff_keyset_pages_walk_their_index(app, sort_by, index, sort_order, get_references):
+    with app.app_context():
+        make_staff(30)
+        def pages():
+            _, cursor = StaffModel.list_staff(page_size = 10, sort_by = sort_by, sort_order = sort_order, get_references = get_references)
+            StaffModel.list_staff(page_size = 10, sort_by = sort_by, sort_order = sort_order, get_references = get_references, cursor = cursor)
+
+        plans = query_plans("staff", pages)
+        assert len(plans) == 2
+        for plan in plans:
+            assert index in plan
+            assert "TEMP B-TREE" not in plan
+
+
+def test_current_timelog_seeks_the_staff_clock_in_index(app):
+    start = datetime(2025, 1, 1, 9)
+    with app.app_context():
+        make_staff(3)
+        db.session.execute(TimeLogModel.__table__.insert(), [{"staff_id": staff_id, "clock_in": start + timedelta(days = day), "work_date": (start + timedelta(days = day)).date(), "updated_at": start}
+                                                            for staff_id in (1, 2, 3) for day in range(10)])
+        db.session.commit()
+
+        for open_only in (False, True):
+            [plan] = query_plans("timelogs", lambda: TimeLogModel.fetch_current_timelog(2, open_only = open_only))
+            assert "ix_timelogs_staff_id_clock_in (staff_id=?)" in plan
+            assert "TEMP B-TREE" not in plan
@@ -0,0 +1,32 @@
+import os
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine
+from admin.models import db, TimeLogModel
+from tests.conftest import TMPDIR, make_staff
+
+
+
+@pytest.fixture
+def replica(app, monkeypatch):
+    """A lagging replica: an empty copy of the schema the writes never reach."""
+    path = os.path.join(TMPDIR, "replica.sqlite3")
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine("sqlite:///" + path)
+    db.metadata.create_all(engine, tables = [table for table in db.metadata.sorted_tables if table.info.get("bind_key") is None])
+    with app.app_context():
+        monkeypatch.setitem(db.engines, "replica", engine)
+    yield engine
+    engine.dispose()
+
+
+def test_current_timelog_is_read_from_the_primary(app, replica):
+    with app.app_context():
+        make_staff(1)
+        timelog_id, _ = TimeLogModel.clock_timelog(1, clock_in = datetime.now().replace(microsecond = 0), clock_out = None)
+
+    with app.app_context():
+        assert TimeLogModel.fetch_timelog(staff_id = 1, current = True)["id"] == timelog_id
+        assert TimeLogModel.fetch_timelog(staff_id = 1, id = timelog_id, current = True)["id"] == timelog_id
+        assert TimeLogModel.fetch_timelog(staff_id = 1) == []
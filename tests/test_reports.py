@@ -0,0 +1,21 @@
+from datetime import date, datetime, time
+from admin.models import db, ScheduleModel, OffDayModel
+from admin.reports import AttendanceReport
+from tests.conftest import make_staff
+
+
+
+def test_absences_start_at_registration_and_skip_full_day_offs_only(app):
+    with app.app_context():
+        db.session.add(ScheduleModel(id = 1, name = "all week", shift_type = "day", shift_start = time(9), shift_ends = time(17)))
+        db.session.commit()
+        make_staff(1, start = 1, schedule_id = 1, registration_date = datetime(2025, 10, 18))
+        make_staff(1, start = 2, schedule_id = 1, registration_date = datetime(2025, 9, 15))
+        for day, is_half_day in ((date(2025, 9, 20), True), (date(2025, 9, 21), False)):
+            db.session.add(OffDayModel(date = day, off_type = "casual", is_half_day = is_half_day, staff_id = 2, day_of_week = day.strftime("%A").lower(), approver_id = 1))
+        db.session.commit()
+
+        rows = {row["staff_id"]: row for row in AttendanceReport(date(2025, 9, 1), date(2025, 9, 30), period = "month").rows()}
+
+    assert rows[1]["absences"] == 0
+    assert rows[2]["absences"] == 16 - 1
@@ -0,0 +1,29 @@
+import pytest
+from datetime import time
+from admin.models import db, ScheduleModel, WeekOffModel
+from utils.utilities import ModelUtil
+
+
+
+def add_schedules(count):
+    for i in range(1, count + 1):
+        db.session.add(ScheduleModel(id = i, name = f"schedule {i:03d}", shift_type = "day", shift_start = time(9), shift_ends = time(17)))
+        db.session.add_all([WeekOffModel(name = "saturday", schedule_id = i), WeekOffModel(name = "sunday", schedule_id = i)])
+    db.session.commit()
+    db.session.expunge_all()
+
+
+@pytest.mark.parametrize("count", [1, 5, 50])
+def test_listing_schedules_with_week_offs_takes_two_queries(app, count):
+    with app.app_context():
+        add_schedules(count)
+
+        with ModelUtil.count_queries(db.engine, expected = 2):
+            schedules = ScheduleModel.list_schedule(get_references = True)
+        assert len(schedules) == count
+        assert all(sorted(schedule["dayoffs"]) == ["saturday", "sunday"] for schedule in schedules)
+
+        db.session.expunge_all()
+        with ModelUtil.count_queries(db.engine, expected = 2):
+            schedules, _ = ScheduleModel.list_schedule(get_references = True, page_size = 20)
+        assert len(schedules) == min(count, 20)
@@ -0,0 +1,84 @@
+import os
+import multiprocessing
+import pytest
+from flask import Flask, session
+from utils.utilities import ServerSideSession, ServerSideSessionInterface, SqliteSessionStore
+from tests.conftest import TMPDIR
+
+
+
+@pytest.fixture
+def store_path():
+    path = os.path.join(TMPDIR, "sessions.sqlite3")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return path
+
+
+def worker(store):
+    """One worker process of the app: its own flask app, sharing the session store and SECRET_KEY."""
+    app = Flask(__name__)
+    app.secret_key = "tests"
+    app.session_interface = ServerSideSessionInterface(store)
+
+    @app.post("/signin/<name>")
+    def signin(name):
+        session["name"] = name
+        return "ok"
+
+    @app.get("/whoami")
+    def whoami():
+        return session.get("name", "anonymous")
+
+    @app.get("/static")
+    def static_page():
+        return "static"
+
+    return app
+
+
+def test_workers_sharing_the_store_serve_each_others_sessions(store_path):
+    first, second = worker(SqliteSessionStore(store_path)), worker(SqliteSessionStore(store_path))
+    client = first.test_client()
+    client.post("/signin/alice")
+    cookie = client.get_cookie("session").value
+
+    other = second.test_client()
+    other.set_cookie("session", cookie)
+    assert other.get("/whoami").text == "alice"
+    other.post("/signin/bob")
+    assert client.get("/whoami").text == "bob"
+
+
+def read_in_child(store, sid, queue):
+    inherited = store._local.connection
+    queue.put((store.get(sid), store._local.connection is not inherited))
+
+
+def test_forked_workers_open_their_own_connection(store_path):
+    store = SqliteSessionStore(store_path)
+    store.set("sid", b"payload", 60)
+
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    child = context.Process(target = read_in_child, args = (store, "sid", queue))
+    child.start()
+    data, reopened = queue.get(timeout = 10)
+    child.join(10)
+
+    assert (data, reopened) == (b"payload", True)
+    assert child.exitcode == 0
+
+
+def test_only_responses_that_read_the_session_vary_on_cookie(store_path):
+    assert not ServerSideSession({"_user_type_model": "staff", "_user_id": "1"}, sid = "sid").accessed
+
+    app = worker(SqliteSessionStore(store_path))
+    client = app.test_client()
+    assert "Cookie" not in client.get("/static").vary
+    assert "Cookie" not in client.get("/whoami").vary
+
+    client.post("/signin/alice")
+    assert "Cookie" not in client.get("/static").vary
+    assert "Cookie" in client.get("/whoami").vary
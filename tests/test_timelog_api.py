@@ -0,0 +1,43 @@
+import pytest
+from admin.models import db, TimeLogModel
+from tests.conftest import make_staff, login
+
+
+
+@pytest.fixture
+def csrf(app, monkeypatch):
+    monkeypatch.setitem(app.config, "WTF_CSRF_ENABLED", True)
+
+
+def test_posts_need_the_csrf_token_from_get(app, csrf):
+    with app.app_context():
+        make_staff(1)
+    client = app.test_client()
+    login(client, 1)
+
+    for post in ({"json": {"clock_in": "2026-10-18 09:00:00"}}, {"data": {"clock_in": "2026-10-18 09:00:00"}}):
+        response = client.post("/employee/api/timelog", **post)
+        assert response.status_code == 400
+        assert response.get_json() == {"error": "The CSRF token is missing."}
+
+    token = client.get("/employee/api/timelog").get_json()["csrf_token"]
+    response = client.post("/employee/api/timelog", json = {"clock_in": "2026-10-18 09:00:00"}, headers = {"X-CSRFToken": token})
+    assert response.status_code == 201
+    with app.app_context():
+        assert db.session.query(TimeLogModel).count() == 1
+
+
+def test_failures_are_logged(app, monkeypatch, caplog):
+    with app.app_context():
+        make_staff(1)
+    client = app.test_client()
+    login(client, 1)
+
+    def clock_timelog(*args, **kwargs):
+        raise RuntimeError("database is down")
+    monkeypatch.setattr(TimeLogModel, "clock_timelog", clock_timelog)
+
+    response = client.post("/employee/api/timelog", json = {"clock_in": "2026-10-18 09:00:00"})
+    assert response.status_code == 500
+    assert "Failed to add timelog of staff: 1" in caplog.text
+    assert "database is down" in caplog.text
@@ -0,0 +1,76 @@
+import io
+import os
+import pytest
+from datetime import datetime, timedelta
+from werkzeug.datastructures import FileStorage
+from admin.models import db, FilesModel, uploader
+
+
+
+@pytest.fixture(autouse = True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(FilesModel, "upload_backoff", 0)
+
+
+def pending_file(app, data = b"report", created_at = None):
+    with app.app_context():
+        filesobj = FilesModel(file_name = "report.txt", file_path = "", file_uri = "", bucket_name = "files", file_type = "txt",
+                              expired_at = datetime.utcnow(), status = "pending", created_at = created_at or datetime.utcnow())
+        db.session.add(filesobj)
+        db.session.commit()
+        if data is not None:
+            FilesModel.spool(filesobj.id, io.BytesIO(data))
+        return filesobj.id
+
+
+def status(app, file_id):
+    with app.app_context():
+        return db.session.get(FilesModel, file_id).status
+
+
+def test_transient_minio_errors_are_retried(app, fake_minio):
+    file_id = pending_file(app)
+    fake_minio.failures = FilesModel.upload_retries
+
+    FilesModel.upload_pending_file(app, file_id, "text/plain")
+
+    assert status(app, file_id) == "uploaded"
+    assert fake_minio.calls["put_object"] == FilesModel.upload_retries + 1
+    assert not os.path.exists(FilesModel.spool_path(file_id))
+
+
+def test_failed_uploads_keep_their_data_for_the_sweep(app, fake_minio):
+    failed_id = pending_file(app)
+    fake_minio.failures = FilesModel.upload_retries + 1
+    with pytest.raises(ConnectionError):
+        FilesModel.upload_pending_file(app, failed_id, "text/plain")
+    assert status(app, failed_id) == "failed"
+    assert os.path.exists(FilesModel.spool_path(failed_id))
+
+    stale_id = pending_file(app, created_at = datetime.utcnow() - timedelta(hours = 1))
+    lost_id = pending_file(app, data = None, created_at = datetime.utcnow() - timedelta(hours = 1))
+    fresh_id = pending_file(app)
+
+    with app.app_context():
+        uploaded, failed, missing = FilesModel.retry_uploads(pending_after = timedelta(minutes = 5))
+
+    assert (uploaded, failed, missing) == ([failed_id, stale_id], [], [lost_id])
+    assert [status(app, i) for i in (failed_id, stale_id, lost_id, fresh_id)] == ["uploaded", "uploaded", "failed", "pending"]
+    assert fake_minio.objects[("files", "report.txt")] == b"report"
+    assert not os.path.exists(FilesModel.spool_path(failed_id))
+
+
+def test_a_full_upload_queue_leaves_the_file_pending_for_the_sweep(app, fake_minio, monkeypatch):
+    monkeypatch.setattr(uploader, "submit", lambda *args, **kwargs: None)
+    with app.app_context():
+        file_id = FilesModel.add_file(FileStorage(io.BytesIO(b"report"), filename = "report.txt", content_type = "text/plain"), bucket = "files", background = True)
+
+    assert status(app, file_id) == "pending"
+    assert "put_object" not in fake_minio.calls
+    with open(FilesModel.spool_path(file_id), "rb") as spooled:
+        assert spooled.read() == b"report"
+
+    with app.app_context():
+        assert FilesModel.retry_uploads(pending_after = timedelta(0)) == ([file_id], [], [])
+    assert status(app, file_id) == "uploaded"
+    assert list(fake_minio.objects.values()) == [b"report"]
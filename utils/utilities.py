@@ -1,12 +1,35 @@
 import os
 import re
+import json
 import minio
+import base64
 import logging
-from datetime import datetime
+import binascii
+import secrets
+import sqlite3
+import inspect
+import threading
+from time import monotonic
+from io import BytesIO
+from collections import OrderedDict, deque
+from queue import Queue, Empty, Full
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, date, time, timedelta
 from dateutil import parser as dateutilparser
 from functools import wraps
-from flask import flash, url_for, redirect
+from itertools import islice
+from PIL import Image, ImageOps
+from flask import flash, url_for, redirect, has_request_context, session as flasksession
+from flask_sqlalchemy.session import Session
+from flask.sessions import SessionInterface, SecureCookieSession
+from flask.json.tag import TaggedJSONSerializer
+from itsdangerous import Signer, BadSignature
 from flask_login import current_user
+from contextlib import contextmanager, nullcontext
+from sqlalchemy import event, select, func, bindparam, and_ as sqlalchemyand, or_ as sqlalchemyor, asc as sqlalchemyasc, desc as sqlalchemydesc
+from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects import sqlite, postgresql
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
 from utils.errors import PositionalArgumentError, UnexpectedArgumentError, InvalidValueError, FormValidationError
@@ -102,9 +125,615 @@ class Logger:
 
 
 
+class TTLCache:
+    """Thread safe in-process LRU cache whose entries expire after ttl seconds."""
+
+    def __init__(self, maxsize = 1024, ttl = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key, default = None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+
+    def set(self, key, value, ttl = None):
+        with self._lock:
+            self._data[key] = (value, monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last = False)
+
+
+    def get_or_set(self, key, factory, ttl = None):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+
+
+class WorkerPool:
+    """Bounded thread pool for work taken off the request path.
+
+    At most max_queue jobs are accepted at a time (queued + running); submit
+    returns None when the pool is saturated so the caller can fall back to
+    doing the work inline.
+    """
+
+    def __init__(self, name, max_workers = 4, max_queue = 256, latency_window = 1000):
+        self.name = name
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = name)
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen = latency_window)
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self.logger = Logger.getLogger(sub_name = f"utils: {name}")
+
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking = False):
+            with self._lock:
+                self._rejected += 1
+            return None
+        with self._lock:
+            self._pending += 1
+        return self._executor.submit(self._run, fn, monotonic(), *args, **kwargs)
+
+
+    def _run(self, fn, queued_at, *args, **kwargs):
+        with self._lock:
+            self._pending -= 1
+            self._running += 1
+        started_at = monotonic()
+        try:
+            result = fn(*args, **kwargs)
+            with self._lock:
+                self._completed += 1
+            return result
+        except Exception as e:
+            with self._lock:
+                self._failed += 1
+            self.logger.error(f"Background job {getattr(fn, '__name__', fn)} failed: {e}")
+            raise e
+        finally:
+            finished_at = monotonic()
+            with self._lock:
+                self._running -= 1
+                self._latencies.append((started_at - queued_at, finished_at - started_at))
+            self._slots.release()
+
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(latency[0] for latency in self._latencies)
+            runs = sorted(latency[1] for latency in self._latencies)
+            return {
+                "queue_depth": self._pending,
+                "running": self._running,
+                "max_queue": self.max_queue,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "wait_seconds": BaseUtil.summarize(waits),
+                "run_seconds": BaseUtil.summarize(runs),
+            }
+
+
+    def shutdown(self, wait = True):
+        self._executor.shutdown(wait = wait)
+
+
+
+
+class GroupCommitWriter:
+    """Runs submitted writes on a single thread, many per transaction.
+
+    handler(items) is called on the writer thread with up to max_batch queued
+    items (waiting at most interval seconds after the first one for more) and
+    must commit and return one result per item. If it raises, the items are
+    retried one by one so a bad write only fails its own future. submit
+    returns a Future, or None when max_queue items are already waiting so the
+    caller can fall back to writing inline. A future cancelled while its item
+    is still queued (e.g. after its caller timed out) is dropped from the
+    batch, so the item is never written; once the batch started cancel()
+    fails and the item's outcome is final. bind(context) sets the context
+    manager factory (e.g. app.app_context) every batch runs in.
+    """
+
+    def __init__(self, name, handler, interval = 0.005, max_batch = 64, max_queue = 1024, latency_window = 1000):
+        self.name = name
+        self.handler = handler
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.context = None
+        self._queue = Queue(maxsize = max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen = latency_window)
+        self._batch_sizes = deque(maxlen = latency_window)
+        self._batches = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._cancelled = 0
+        self.logger = Logger.getLogger(sub_name = f"utils: {name}")
+
+
+    def bind(self, context):
+        if self.context is None:
+            self.context = context
+
+
+    def submit(self, item):
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future, monotonic()))
+        except Full:
+            with self._lock:
+                self._rejected += 1
+            return None
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target = self._run, name = self.name, daemon = True)
+                    self._thread.start()
+        return future
+
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = monotonic() + self.interval
+        while len(batch) < self.max_batch:
+            timeout = deadline - monotonic()
+            try:
+                batch.append(self._queue.get(timeout = timeout) if timeout > 0 else self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+
+    def _flush(self, batch):
+        items = [item for item, _, _ in batch]
+        with (self.context() if self.context else nullcontext()):
+            try:
+                return [(result, None) for result in self.handler(items)]
+            except Exception as e:
+                if len(batch) == 1:
+                    return [(None, e)]
+                self.logger.warning(f"Batch of {len(batch)} writes failed ({e}), retrying one by one")
+            results = []
+            for item in items:
+                try:
+                    results.append((self.handler([item])[0], None))
+                except Exception as e:
+                    results.append((None, e))
+            return results
+
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            stopping = any(item is self._queue for item, _, _ in batch)
+            batch = [entry for entry in batch if entry[0] is not self._queue]
+            queued = len(batch)
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if queued > len(batch):
+                with self._lock:
+                    self._cancelled += queued - len(batch)
+            if not batch:
+                if stopping or not queued:
+                    return
+                continue
+            try:
+                results = self._flush(batch)
+            except Exception as e:
+                results = [(None, e)] * len(batch)
+            finished_at = monotonic()
+
+            with self._lock:
+                self._batches += 1
+                self._batch_sizes.append(len(batch))
+                for (_, future, queued_at), (result, error) in zip(batch, results):
+                    self._latencies.append(finished_at - queued_at)
+                    if error is None:
+                        self._completed += 1
+                    else:
+                        self._failed += 1
+            for (_, future, _), (result, error) in zip(batch, results):
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+            if stopping:
+                return
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "batches": self._batches,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "cancelled": self._cancelled,
+                "batch_size": BaseUtil.summarize(sorted(self._batch_sizes)),
+                "latency_seconds": BaseUtil.summarize(sorted(self._latencies)),
+            }
+
+
+    def shutdown(self, wait = True):
+        if self._thread is not None:
+            self._queue.put((self._queue, None, monotonic()))
+            if wait:
+                self._thread.join()
+            self._thread = None
+
+
+
+
+class RoutingSession(Session):
+    """flask-sqlalchemy session that sends the selects made inside a replica() block to the "replica" bind (when one is configured).
+
+    Everything else stays on the primary: flushes and DML, the selects of a
+    primary() block nested in it, every statement of a session that has
+    already written (read your writes within the request) and, for
+    sticky_seconds after a request committed a write, the following
+    requests of the same user (read your writes across a redirect).
+    """
+
+    replica_bind = "replica"
+    sticky_seconds = int(os.getenv("DB_REPLICA_STICKY_SECONDS", 5))
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self._replica_depth = 0
+        self._wrote = False
+
+
+    @contextmanager
+    def replica(self):
+        self._replica_depth += 1
+        try:
+            yield self
+        finally:
+            self._replica_depth -= 1
+
+
+    @contextmanager
+    def primary(self):
+        """Reads from the primary inside a replica() block, for the reads that must see the user's own latest writes."""
+        depth, self._replica_depth = self._replica_depth, 0
+        try:
+            yield self
+        finally:
+            self._replica_depth = depth
+
+
+    def get_bind(self, mapper = None, clause = None, bind = None, **kwargs):
+        if self._flushing or getattr(clause, "is_dml", False):
+            self._wrote = True
+        elif self._replica_depth and not self._wrote and bind is None and (clause is None or getattr(clause, "is_select", False)) and not self.sticky():
+            engine = self._db.engines.get(self.replica_bind)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper = mapper, clause = clause, bind = bind, **kwargs)
+
+
+    def sticky(self):
+        return has_request_context() and flasksession.get("_primary_until", 0) > datetime.now().timestamp()
+
+
+    def mark_written(self):
+        """Keeps the session, and the user's next requests for sticky_seconds, on the primary; for writes committed elsewhere (e.g. by a GroupCommitWriter)."""
+        self._wrote = True
+        if has_request_context() and self.replica_bind in self._db.engines:
+            flasksession["_primary_until"] = int(datetime.now().timestamp()) + self.sticky_seconds
+
+
+    def commit(self):
+        super().commit()
+        if self._wrote:
+            self.mark_written()
+
+
+
+
+class DatabaseEngine:
+    """Database settings from the environment: DATABASE_URL (sqlite or postgresql, the local sqlite file by default), the connection pool and, with SQLITE_MODE=tuned, per connection pragmas for sqlite.
+
+    In tuned mode every new sqlite connection switches to WAL journaling, so
+    readers no longer block behind the single writer, waits up to
+    SQLITE_BUSY_TIMEOUT_MS for the write lock instead of failing with
+    "database is locked", and gets a larger page cache and memory mapped reads.
+    """
+
+    SQLITE_MODES = ("default", "tuned")
+    DIALECTS = ("sqlite", "postgresql")
+
+    def __init__(self, default_uri):
+        uri = os.getenv("DATABASE_URL") or default_uri
+        if uri.startswith("postgres://"):
+            uri = "postgresql://" + uri[len("postgres://"):]
+        self.url = make_url(uri)
+        BaseUtil.perform_value_check(self.url.get_backend_name(), self.DIALECTS, "DATABASE_URL")
+        self.sqlite_mode = os.getenv("SQLITE_MODE", "default")
+        BaseUtil.perform_value_check(self.sqlite_mode, self.SQLITE_MODES, "SQLITE_MODE")
+        replica_uri = os.getenv("DATABASE_REPLICA_URL")
+        self.replica_url = make_url(replica_uri) if replica_uri else None
+
+
+    @property
+    def uri(self):
+        return self.url.render_as_string(hide_password = False)
+
+
+    @property
+    def is_sqlite(self):
+        return self.url.get_backend_name() == "sqlite"
+
+
+    def engine_options(self):
+        """Pool settings passed to create_engine (SQLALCHEMY_ENGINE_OPTIONS); an in memory sqlite database keeps its single connection pool."""
+        if self.is_sqlite and self.url.database in (None, "", ":memory:"):
+            return {}
+        return {"pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+                "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+                "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", 30)),
+                "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+                "pool_pre_ping": bool(int(os.getenv("DB_POOL_PRE_PING", 0 if self.is_sqlite else 1)))}
+
+
+    def pragmas(self):
+        """PRAGMA name -> value run on every new sqlite connection, empty outside tuned mode."""
+        if not self.is_sqlite or self.sqlite_mode != "tuned":
+            return {}
+        return {"journal_mode": "WAL",
+                "synchronous": "NORMAL",
+                "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+                "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", 65536)),
+                "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE_MB", 256)) * 1024 * 1024,
+                "temp_store": "MEMORY"}
+
+
+    def configure(self, app):
+        """Sets the flask-sqlalchemy config of app, call before db.init_app; DATABASE_REPLICA_URL becomes the "replica" bind read by RoutingSession."""
+        app.config["SQLALCHEMY_DATABASE_URI"] = self.uri
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = self.engine_options()
+        if self.replica_url is not None:
+            app.config["SQLALCHEMY_BINDS"] = {RoutingSession.replica_bind: {"url": self.replica_url.render_as_string(hide_password = False), **self.engine_options()}}
+
+
+    def init_app(self, app, db):
+        """Registers the pragma connect hook on every engine of db (the default one and the binds), call after db.init_app."""
+        pragmas = self.pragmas()
+        if not pragmas:
+            return
+        with app.app_context():
+            for engine in db.engines.values():
+                if engine.dialect.name == "sqlite":
+                    event.listen(engine, "connect", lambda connection, record: self.apply_pragmas(connection, pragmas))
+
+
+    @staticmethod
+    def apply_pragmas(connection, pragmas):
+        cursor = connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+
+
+
+class SqliteSessionStore:
+    """Session payloads in a sqlite file, shared by every worker process of one host.
+
+    Connections are opened lazily per thread and per process, so a store
+    created before the workers fork (e.g. gunicorn --preload) never hands
+    them a connection inherited from the parent.
+    """
+
+    def __init__(self, path, purge_every = 1000):
+        self.path = path
+        self.purge_every = purge_every
+        self._writes = 0
+        self._local = threading.local()
+
+
+    @contextmanager
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout = 30, isolation_level = None)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data BLOB NOT NULL, expires_at INTEGER NOT NULL)")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        yield connection
+
+
+    def get(self, sid):
+        with self.connection() as connection:
+            row = connection.execute("SELECT data FROM sessions WHERE id = ? AND expires_at > ?", (sid, int(datetime.now().timestamp()))).fetchone()
+        return row[0] if row else None
+
+
+    def set(self, sid, data, ttl):
+        now = int(datetime.now().timestamp())
+        with self.connection() as connection:
+            connection.execute("INSERT INTO sessions (id, data, expires_at) VALUES (?, ?, ?) ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at", (sid, data, now + ttl))
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                connection.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+
+
+    def delete(self, sid):
+        with self.connection() as connection:
+            connection.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+
+
+
+
+class RedisSessionStore:
+    """Session payloads in redis (or any server speaking its protocol), expired by redis itself; needs the optional redis package."""
+
+    def __init__(self, url, prefix = "session:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("SESSION_BACKEND=redis needs the redis package, install it with: pip install redis") from e
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+
+    def get(self, sid):
+        return self.client.get(self.prefix + sid)
+
+
+    def set(self, sid, data, ttl):
+        self.client.set(self.prefix + sid, data, ex = ttl)
+
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+
+
+
+class ServerSideSession(SecureCookieSession):
+
+    def __init__(self, initial = None, sid = None):
+        super().__init__(initial)
+        self.sid = sid
+        # dict.get: SecureCookieSession.get would mark the session accessed (Vary: Cookie on every response)
+        self.user = (dict.get(self, "_user_type_model"), dict.get(self, "_user_id"))
+
+
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Keeps the session payload in a store (SqliteSessionStore, RedisSessionStore) and only a signed random session id in the cookie.
+
+    Any worker sharing the store and SECRET_KEY can serve any request. The
+    payload is the compact tagged json flask uses for cookie sessions, it is
+    only written back when the session changed, and the id is rotated when
+    the logged in user changes.
+    """
+
+    BACKENDS = ("cookie", "sqlite", "redis")
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, ttl = 7 * 86400):
+        self.store = store
+        self.ttl = ttl
+
+
+    @classmethod
+    def from_env(cls, default_sqlite_path):
+        """The interface for SESSION_BACKEND (sqlite, redis), None for cookie which keeps flask's signed cookie sessions."""
+        backend = os.getenv("SESSION_BACKEND", "cookie")
+        BaseUtil.perform_value_check(backend, cls.BACKENDS, "SESSION_BACKEND")
+        if backend == "cookie":
+            return None
+        if backend == "sqlite":
+            store = SqliteSessionStore(os.getenv("SESSION_SQLITE_PATH") or default_sqlite_path)
+        else:
+            store = RedisSessionStore(os.getenv("SESSION_REDIS_URL", "redis://127.0.0.1:6379/0"))
+        return cls(store, ttl = int(os.getenv("SESSION_TTL", 7 * 86400)))
+
+
+    def signer(self, app):
+        return Signer(app.secret_key, salt = "server-side-session")
+
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self.signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            data = self.store.get(sid) if sid else None
+            if data is not None:
+                return ServerSideSession(self.serializer.loads(data), sid = sid)
+        return ServerSideSession(sid = secrets.token_urlsafe(32))
+
+
+    def save_session(self, app, session, response):
+        name, domain, path = self.get_cookie_name(app), self.get_cookie_domain(app), self.get_cookie_path(app)
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain = domain, path = path, secure = self.get_cookie_secure(app), httponly = self.get_cookie_httponly(app), samesite = self.get_cookie_samesite(app))
+            return
+        if session.accessed:
+            response.vary.add("Cookie")
+        if not self.should_set_cookie(app, session):
+            return
+
+        if session.user != (session.get("_user_type_model"), session.get("_user_id")):
+            self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.user = (session.get("_user_type_model"), session.get("_user_id"))
+        self.store.set(session.sid, self.serializer.dumps(dict(session)).encode(), self.ttl)
+        response.set_cookie(name, self.signer(app).sign(session.sid).decode(), expires = self.get_expiration_time(app, session), domain = domain, path = path,
+                            secure = self.get_cookie_secure(app), httponly = self.get_cookie_httponly(app), samesite = self.get_cookie_samesite(app))
+
+
+
+
 class MinioDB:
 
+    link_expiry = timedelta(hours = int(os.getenv("MINIO_LINK_EXPIRY_HOURS", 24)))
+    link_cache = TTLCache(maxsize = int(os.getenv("MINIO_LINK_CACHE_SIZE", 10000)), ttl = link_expiry.total_seconds() / 2)
+    known_buckets = set()
+    _buckets_loaded = False
+    _buckets_lock = threading.Lock()
+
     def __init__(self):
+        self.region = os.getenv("MINIO_REGION", "eu-central-1")
         self.minioClient = self.get_minio_client()
         
 
@@ -117,22 +746,40 @@ class MinioDB:
         minio_client = minio.Minio(endpoint=os.getenv("MINIO_URL").rsplit("/",1)[0],
                                 access_key=os.getenv("MINIO_USER"),
                                 secret_key=os.getenv("MINIO_PWD"),
-                                secure=bool(int(os.getenv("MINIO_USE_SECURE",0))))
+                                secure=bool(int(os.getenv("MINIO_USE_SECURE",0))),
+                                region=self.region)
         return minio_client
 
 
     def create_bucket(self, bucket_name):
         """Creates bucket on MINIO.
 
-        Default location given is eu-central-1.
+        The bucket is created in MINIO_REGION (eu-central-1 by default), the
+        region the links are signed for.
         Locations available:
         'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2',
         'eu-west-1', 'eu-west-2', 'ca-central-1', 'eu-central-1', 'sa-east-1',
         'cn-north-1', 'ap-southeast-1', 'ap-southeast-2',
         'ap-northeast-1', 'ap-northeast-2'
         """
-        if not self.minioClient.bucket_exists(bucket_name):
-            self.minioClient.make_bucket(bucket_name, location='eu-central-1')
+        if bucket_name in self.known_buckets:
+            return
+
+        with self._buckets_lock:
+            if not MinioDB._buckets_loaded:
+                self.load_buckets()
+                if bucket_name in self.known_buckets:
+                    return
+
+            if not self.minioClient.bucket_exists(bucket_name):
+                self.minioClient.make_bucket(bucket_name, location=self.region)
+            self.known_buckets.add(bucket_name)
+
+
+    def load_buckets(self):
+        """Fills the process wide set of known buckets with a single listing of MINIO."""
+        MinioDB.known_buckets.update(bucket.name for bucket in self.minioClient.list_buckets())
+        MinioDB._buckets_loaded = True
 
 
     def upload_file(self, bucket_name, object_name, file_path):
@@ -164,6 +811,7 @@ class MinioDB:
     def remove_bucket(self, bucket_name):
         """Removes bucket from MINIO."""
         self.minioClient.remove_bucket(bucket_name=bucket_name)
+        self.known_buckets.discard(bucket_name)
 
 
 
@@ -203,12 +851,84 @@ class MinioDB:
             return None
 
 
-    def get_object_link(self, bucket_name, object_name, method = "HTTP"):
+    def get_object_link(self, bucket_name, object_name, method = "HTTP", expires = timedelta(days = 7)):
         """creates shareable public link of the object(valid till 7 days)"""
-        object_link = self.minioClient.get_presigned_url(method = method, bucket_name=bucket_name, object_name= object_name)
+        object_link = self.minioClient.get_presigned_url(method = method, bucket_name=bucket_name, object_name= object_name, expires = expires)
         return object_link
 
 
+    def get_cached_object_link(self, bucket_name, object_name):
+        """returns a GET link of the object from the process wide link cache, signing it locally on a miss"""
+        return self.link_cache.get_or_set((bucket_name, object_name), lambda: self.get_object_link(bucket_name, object_name, "GET", self.link_expiry))
+
+
+
+
+
+class Record(dict):
+    """Row of a projected query; a plain dict which also allows attribute access to its keys."""
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+
+
+class Projection:
+    """Selects only the requested columns of one or more models and parses the rows into Records.
+
+    sources maps an alias to (model, fields) (all columns when fields is
+    None) and renames maps an alias to {field: key}. The labelled columns and
+    output keys are compiled once per query shape by Projection.compile and
+    reused, so no ORM instance is hydrated or identity mapped per row.
+    """
+
+    _compiled = {}
+
+    def __init__(self, sources: dict, renames: dict = {}):
+        columns = []
+        keys = []
+        for alias, (model, fields) in sources.items():
+            renamedkey = renames.get(alias, {})
+            for field in (fields or model.__table__.columns.keys()):
+                if field not in model.__table__.columns:
+                    continue
+                key = renamedkey.get(field, field)
+                columns.append(getattr(model, field).label(key))
+                keys.append(key)
+        self.columns = tuple(columns)
+        self.keys = tuple(keys)
+
+
+    @classmethod
+    def compile(cls, sources: dict, renames: dict = {}):
+        shape = (tuple((alias, model, tuple(fields) if fields else None) for alias, (model, fields) in sources.items()),
+                 tuple((alias, tuple(renamed.items())) for alias, renamed in renames.items()))
+        projection = cls._compiled.get(shape)
+        if projection is None:
+            projection = cls._compiled.setdefault(shape, cls(sources, renames))
+        return projection
+
+
+    def query(self, session):
+        return session.query(*self.columns)
+
+
+    def parse(self, rows):
+        keys = self.keys
+        return [Record(zip(keys, row)) for row in rows]
+
+
+    def parse_one(self, row):
+        if row is None:
+            return None
+        return Record(zip(self.keys, row))
+
 
 
 
@@ -225,6 +945,7 @@ class ModelUtil:
             for data in modeldata:
                 row = data.__dict__
                 if bool(relationship_info):
+                    row = dict(row)
                     rel = ModelUtil.parse_relationship(data, relationship_info['relationship'], relationship_info.get('fields', {}), relationship_info.get('renames',{}), relationship_info.get("value_only",False))
                     row.update(rel)
                 
@@ -242,7 +963,8 @@ class ModelUtil:
             
             row = modeldata.__dict__
             if bool(relationship_info):
-                    rel = ModelUtil.parse_relationship(data, relationship_info['relationship'], relationship_info.get('fields', {}), relationship_info.get('renames',{}), relationship_info.get("value_only",False))
+                    row = dict(row)
+                    rel = ModelUtil.parse_relationship(modeldata, relationship_info['relationship'], relationship_info.get('fields', {}), relationship_info.get('renames',{}), relationship_info.get("value_only",False))
                     row.update(rel)
             
             if not fields:
@@ -291,6 +1013,129 @@ class ModelUtil:
 
 
 
+    @staticmethod
+    def iter_batches(query, batch_size = 1000):
+        """Yields the rows of query in lists of batch_size, streaming them from a server side cursor (yield_per) instead of fetching every row at once."""
+        rows = iter(query.yield_per(batch_size))
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
+
+
+    @staticmethod
+    def iter_raw_batches(session, statement, batch_size = 10000):
+        """Yields the rows of a Core select as lists of plain DBAPI tuples, skipping Row construction and result processing.
+
+        Meant for bulk numeric reads (e.g. into NumPy arrays): the statement is
+        compiled with literal binds, so only select expressions whose raw
+        driver values are usable as is should be passed.
+        """
+        sql = str(statement.compile(session.get_bind(), compile_kwargs = {"literal_binds": True}))
+        cursor = session.connection().connection.cursor()
+        try:
+            cursor.execute(sql)
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    return
+                yield batch
+        finally:
+            cursor.close()
+
+
+    @staticmethod
+    def upsert_insert(session, table):
+        """Returns the dialect specific insert(table) for the session's bind, which has on_conflict_do_update/on_conflict_do_nothing and excluded (sqlite and postgresql only)."""
+        dialects = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+        dialect = session.get_bind().dialect.name
+        BaseUtil.perform_value_check(dialect, list(dialects), "dialect")
+        return dialects[dialect](table)
+
+
+    @staticmethod
+    def backfill_frozen_column(session, model, column, fields, derive, batch_size = 1000):
+        """Rewrites column on the rows whose value is shared with other rows (a default that was evaluated once at import instead of per row), batch_size rows per transaction.
+
+        derive gets the values of fields of a row and returns the repaired
+        value, or None to leave the row as it is. Other onupdate columns of
+        the table keep their values. Returns the number of rows rewritten.
+        """
+        table = model.__table__
+        target = table.c[column]
+        frozen = session.scalars(select(target).group_by(target).having(func.count() > 1)).all()
+        if not frozen:
+            return 0
+        statement = (table.update().where(table.c.id == bindparam("row_id"))
+                          .values({column: bindparam("value"), **{other.name: other for other in table.c if other.onupdate is not None and other.name != column}}))
+
+        written, last_id = 0, None
+        while True:
+            query = select(table.c.id, *[table.c[field] for field in fields]).where(target.in_(frozen)).order_by(table.c.id).limit(batch_size)
+            if last_id is not None:
+                query = query.where(table.c.id > last_id)
+            rows = session.execute(query).all()
+            if not rows:
+                return written
+
+            last_id = rows[-1][0]
+            values = [{"row_id": row[0], "value": value} for row in rows if (value := derive(*row[1:])) is not None]
+            if values:
+                session.execute(statement, values)
+            session.commit()
+            written += len(values)
+
+
+    @staticmethod
+    def on_replica(db):
+        """Decorator running the function, or iterating the generator it returns, with db.session reading from the replica bind (see RoutingSession)."""
+        def decorator(f):
+            if inspect.isgeneratorfunction(f):
+                @wraps(f)
+                def decorated_generator(*args, **kwargs):
+                    with db.session().replica():
+                        yield from f(*args, **kwargs)
+                return decorated_generator
+
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                with db.session().replica():
+                    return f(*args, **kwargs)
+            return decorated_function
+        return decorator
+
+
+    @staticmethod
+    def eager_load(query, model, relationships: list|tuple, strategy = "selectin"):
+        """Loads the given relationships of every row with the query (selectin: one extra IN query per relationship, joined: a LEFT JOIN) instead of lazily per row."""
+        BaseUtil.perform_value_check(strategy, ["selectin", "joined"], "strategy")
+        loader = selectinload if strategy == "selectin" else joinedload
+        return query.options(*[loader(getattr(model, relationship)) for relationship in relationships])
+
+
+    @staticmethod
+    @contextmanager
+    def count_queries(engine, expected = None):
+        """Counts the statements executed on engine inside the block; raises AssertionError if expected is given and differs.
+
+            with ModelUtil.count_queries(db.engine, expected = 2) as queries:
+                ScheduleModel.list_schedule(get_references = True)
+        """
+        statements = []
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+        if expected is not None and len(statements) != expected:
+            raise AssertionError(f"expected {expected} queries, executed {len(statements)}:\n" + "\n".join(statements))
+
+
     @staticmethod
     def parse_kwargs(kwargs: dict, availkwargs: list|tuple, ignore_if_empty = False):
         data = {}
@@ -328,6 +1173,62 @@ class ModelUtil:
             parsed_model_data_append(newdata)
         
         return parsed_model_data
+
+
+    @staticmethod
+    def encode_cursor(values: list|tuple):
+        values = [value.isoformat() if isinstance(value, (datetime, date, time)) else value for value in values]
+        return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+    @staticmethod
+    def decode_cursor(cursor: str, columns: list|tuple):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            if not isinstance(values, list) or len(values) != len(columns):
+                raise ValueError(cursor)
+            decoded = []
+            for value, column in zip(values, columns):
+                python_type = column.type.python_type
+                if value is not None and python_type in (datetime, date, time):
+                    value = python_type.fromisoformat(value)
+                decoded.append(value)
+            return decoded
+        except Exception:
+            raise InvalidValueError(paramname = "cursor", value = cursor, expectedvalue = ["cursor returned by the previous page"])
+
+
+    @staticmethod
+    def keyset_paginate(query, model, sort_by = "id", sort_order = "asc", cursor = None, page_size = 50, sortable = ("id",)):
+        """Returns (rows, next_cursor) for one page of query ordered by (sort_by, id); next_cursor is None on the last page."""
+        BaseUtil.perform_value_check(sort_by, sortable, "sort_by")
+        BaseUtil.perform_value_check(sort_order, ["asc", "desc"], "sort_order")
+
+        sortcol = getattr(model, sort_by)
+        keycols = [model.id] if sort_by == "id" else [sortcol, model.id]
+        direction = sqlalchemyasc if sort_order == "asc" else sqlalchemydesc
+
+        if cursor:
+            values = ModelUtil.decode_cursor(cursor, keycols)
+            conditions = []
+            for idx, keycol in enumerate(keycols):
+                after = keycol > values[idx] if sort_order == "asc" else keycol < values[idx]
+                conditions.append(sqlalchemyand(*[keycols[i] == values[i] for i in range(idx)], after))
+            query = query.filter(sqlalchemyor(*conditions))
+
+        rows = query.order_by(*[direction(keycol) for keycol in keycols]).limit(page_size + 1).all()
+        if len(rows) <= page_size:
+            return rows, None
+
+        rows = rows[:page_size]
+        last = rows[-1]
+        if isinstance(last, model):
+            values = [getattr(last, keycol.key) for keycol in keycols]
+        elif all(keycol.key in last._mapping for keycol in keycols):
+            values = [last._mapping[keycol.key] for keycol in keycols]
+        else:
+            values = [getattr(last[0], keycol.key) for keycol in keycols]
+        return rows, ModelUtil.encode_cursor(values)
     
 
 
@@ -357,6 +1258,20 @@ class BaseUtil:
                 return False
 
 
+    @staticmethod
+    def summarize(values: list|tuple):
+        """count, mean, p50, p95 and max of already sorted values"""
+        if not values:
+            return {"count": 0, "mean": None, "p50": None, "p95": None, "max": None}
+        return {
+            "count": len(values),
+            "mean": sum(values) / len(values),
+            "p50": values[int(0.50 * (len(values) - 1))],
+            "p95": values[int(0.95 * (len(values) - 1))],
+            "max": values[-1],
+        }
+
+
     @staticmethod
     def perform_value_check(paramvalue, expectedvalue, param_name, error="raise"):
         if isinstance(expectedvalue,(list,tuple,set)):
@@ -554,6 +1469,19 @@ class FormUtil:
 
 class FlaskUtil:
 
+    @staticmethod
+    def get_pagination_args(args, sortable, default_page_size = 50, max_page_size = 200, default_sort_by = "id", default_sort_order = "asc"):
+        sort_by = args.get("sort_by", default_sort_by)
+        sort_order = args.get("sort_order", default_sort_order)
+        page_size = args.get("page_size", default_page_size, type = int)
+        return {
+            "page_size": min(max(page_size or default_page_size, 1), max_page_size),
+            "cursor": args.get("cursor") or None,
+            "sort_by": sort_by if sort_by in sortable else default_sort_by,
+            "sort_order": sort_order if sort_order in ("asc", "desc") else default_sort_order,
+        }
+
+
     @staticmethod
     def admin_required(redirecturl, message='Required permissions are missing.', messagecategory="error"):
         def decorator(f):
@@ -587,10 +1515,100 @@ class FlaskUtil:
 
 class ImageUtil:
 
+    signatures = {
+        "png": (b"\x89PNG\r\n\x1a\n",),
+        "jpeg": (b"\xff\xd8\xff",),
+        "jpg": (b"\xff\xd8\xff",),
+        "webp": (b"RIFF", b"WEBP"),
+    }
+
 
     @staticmethod
     def add_required_padding(base64_string):
         missing_padding = len(base64_string) % 4
         if missing_padding:
             base64_string += '=' * (4 - missing_padding)
-        return base64_string
\ No newline at end of file
+        return base64_string
+
+
+    @staticmethod
+    def decode_data_url(data_url: str, max_size: int, exts = ("png", "jpeg", "jpg", "webp"), chunk_size = 64 * 1024):
+        """Decodes a base64 image data url chunk by chunk into a BytesIO, returns (stream, ext, size).
+
+        The header, the decoded size and the image signature are validated
+        before the full image is decoded, so oversized or non image payloads
+        are rejected without allocating their buffer.
+        """
+        comma = data_url.find(",", 0, 100)
+        header = data_url[:comma]
+        if comma < 0 or not header.startswith("data:image/") or not header.endswith(";base64"):
+            raise FormValidationError("Invalid image data")
+
+        ext = header[len("data:image/"):-len(";base64")].lower()
+        if ext not in exts:
+            raise FormValidationError(f"Image with extension {ext} not allowed. Pls upload the image with following extensions: ({', '.join(exts)})")
+
+        start = comma + 1
+        encodedsize = len(data_url) - start
+        padding = data_url[-2:].count("=")
+        size = (encodedsize * 3) // 4 - (padding if encodedsize % 4 == 0 else 0)
+        if size <= 0:
+            raise FormValidationError("Image Size should be more than 0 bytes")
+        if size > max_size:
+            raise FormValidationError(f"Image Size should not be more than {max_size / (1000 * 1000):g} MB")
+
+        chunk_size -= chunk_size % 4
+        image = BytesIO()
+        try:
+            for offset in range(start, len(data_url), chunk_size):
+                chunk = data_url[offset:offset + chunk_size]
+                if len(chunk) < chunk_size:
+                    chunk = ImageUtil.add_required_padding(chunk)
+                decoded = binascii.a2b_base64(chunk)
+                if offset == start and not ImageUtil.has_signature(decoded, ext):
+                    raise FormValidationError("Invalid image data")
+                image.write(decoded)
+        except binascii.Error:
+            raise FormValidationError("Invalid image data")
+
+        size = image.tell()
+        image.seek(0)
+        return image, ext, size
+
+
+    @staticmethod
+    def has_signature(data, ext):
+        signature = ImageUtil.signatures.get(ext, ())
+        if ext == "webp":
+            return data[:4] == signature[0] and data[8:12] == signature[1]
+        return any(data.startswith(sign) for sign in signature)
+
+
+    @staticmethod
+    def build_variants(data: bytes, image_format = "WEBP", quality = 80, max_dimension = 1280, thumbnail_size = 160):
+        """Re-encodes image data as a compressed master (bounded to max_dimension) and a thumbnail.
+
+        Returns (master bytes, thumbnail bytes, extension) or None when the
+        data can't be decoded as an image.
+        """
+        try:
+            image = Image.open(BytesIO(data))
+            image = ImageOps.exif_transpose(image)
+        except Exception:
+            return None
+
+        image_format = image_format.upper()
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+
+        image.thumbnail((max_dimension, max_dimension))
+        master = BytesIO()
+        image.save(master, format = image_format, quality = quality, optimize = True)
+
+        image.thumbnail((thumbnail_size, thumbnail_size))
+        thumbnail = BytesIO()
+        image.save(thumbnail, format = image_format, quality = quality, optimize = True)
+
+        return master.getvalue(), thumbnail.getvalue(), "jpg" if image_format == "JPEG" else image_format.lower()